@@ -1,10 +1,20 @@
 import os
 import json
+import time
+import uuid
+import atexit
+import threading
 import requests
 import sys
 from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for
+from flask import Flask, render_template, request, redirect, url_for, jsonify, Response, stream_with_context
 from markdown import convert_markdown
+from vitals import VitalsStore, VITAL_FIELDS
+from tasks import TaskExecutor
+from context_encoder import encode_context
+from long_query import chunk_records, map_reduce_answer
+from ollama_options import classify_question, choose_options
+from records_io import EXPORT_FORMATS, RecordIndex, parse_keywords, export_records, import_records
 
 # 設定の読み込み: config.pyがあれば優先、なければ環境変数を使用
 try:
@@ -12,12 +22,21 @@ try:
     OLLAMA_URL = config.OLLAMA_URL
     OLLAMA_MODEL = config.OLLAMA_MODEL
     DEFAULT_DATA_DIR = config.DEFAULT_DATA_DIR
+    TASK_WORKERS = getattr(config, 'TASK_WORKERS', 2)
+    CONTEXT_TOKEN_BUDGET = getattr(config, 'CONTEXT_TOKEN_BUDGET', 3000)
+    LONG_QUERY_PARALLELISM = getattr(config, 'LONG_QUERY_PARALLELISM', 2)
+    OLLAMA_MODEL_OPTIONS = getattr(config, 'OLLAMA_MODEL_OPTIONS', {})
     print("config.py から設定を読み込みました（開発環境）", file=sys.stderr)
 except ImportError:
     # config.pyがない場合は環境変数から読み込み（デプロイ環境）
     OLLAMA_URL = os.getenv('OLLAMA_URL')
     OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'llama3')
     DEFAULT_DATA_DIR = os.getenv('DATA_DIR', 'data')
+    TASK_WORKERS = int(os.getenv('TASK_WORKERS', '2'))
+    CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '3000'))
+    LONG_QUERY_PARALLELISM = int(os.getenv('LONG_QUERY_PARALLELISM', '2'))
+    # モデルごとの追加オプション（JSON形式、例: {"llama3": {"num_thread": 8, "num_batch": 512}}）
+    OLLAMA_MODEL_OPTIONS = json.loads(os.getenv('OLLAMA_MODEL_OPTIONS', '{}'))
     
     if not OLLAMA_URL:
         print("ERROR: OLLAMA_URL が設定されていません。", file=sys.stderr)
@@ -28,6 +47,32 @@ except ImportError:
 
 app = Flask(__name__)
 
+# システムプロンプト
+SYSTEM_PROMPT = """あなたは健康管理をサポートするAIアシスタントです。
+ユーザーの健康記録に基づいて、親切で正確なアドバイスを提供してください。
+
+IMPORTANT: 必ず日本語で回答してください。英語での回答は絶対に禁止です。
+重要: どのような質問でも、必ず日本語で答えてください。"""
+
+# データディレクトリごとの数値データストア（初回アクセス時に既存記録から一括構築）
+_vitals_stores = {}
+_vitals_stores_lock = threading.Lock()
+
+# データディレクトリごとの記録ファイル名インデックス（一覧表示のページ送り用）
+_record_indexes = {}
+
+# ページあたりの記録数の上限
+RECORDS_PAGE_LIMIT_MAX = 100
+
+# /api/stats が返す移動平均の点数（既定値と上限）
+STATS_MOVING_AVERAGE_LIMIT_DEFAULT = 30
+STATS_MOVING_AVERAGE_LIMIT_MAX = 366
+
+# データディレクトリごとのバックグラウンドタスク実行器（キューは DATA_DIR/.tasks に永続化）
+TASK_QUEUE_DIRNAME = '.tasks'
+_task_executors = {}
+_task_executors_lock = threading.Lock()
+
 
 def get_ollama_config():
     """Ollama設定を取得する"""
@@ -86,6 +131,9 @@ def load_health_records(data_dir=None, days=None, keywords=None):
         from datetime import datetime, timedelta
         cutoff_date = datetime.now() - timedelta(days=days)
     
+    # コンマが含まれている場合はコンマ区切り、そうでなければスペース区切り
+    keyword_list = parse_keywords(keywords)
+    
     for filename in os.listdir(data_dir):
         if filename.endswith('.json') and filename.startswith('health_record_'):
             filepath = os.path.join(data_dir, filename)
@@ -99,17 +147,9 @@ def load_health_records(data_dir=None, days=None, keywords=None):
                         if record_timestamp < cutoff_date:
                             continue
                     
-                    # キーワードフィルタリング
-                    if keywords is not None and keywords.strip():
-                        # コンマが含まれている場合はコンマ区切り、そうでなければスペース区切り
-                        if ',' in keywords:
-                            keyword_list = [kw.strip() for kw in keywords.split(',')]
-                        else:
-                            keyword_list = keywords.split()
-                        
-                        # いずれかのキーワードが含まれているかチェック（OR条件）
-                        if not any(kw in record['health_record'] for kw in keyword_list if kw):
-                            continue
+                    # キーワードフィルタリング（いずれかのキーワードが含まれているかチェック、OR条件）
+                    if keyword_list and not any(kw in record['health_record'] for kw in keyword_list):
+                        continue
                     
                     records.append(record)
             except (json.JSONDecodeError, FileNotFoundError, KeyError, ValueError):
@@ -118,41 +158,206 @@ def load_health_records(data_dir=None, days=None, keywords=None):
     return records
 
 
-def create_ollama_payload(message, data_dir=None, days=None, keywords=None):
-    """Ollamaに送信するペイロードを作成する"""
-    ollama_config = get_ollama_config()
+def get_vitals_store(data_dir=None):
+    """数値データストアを取得する（未構築なら既存の記録から一括抽出する）"""
+    if data_dir is None:
+        data_dir = app.config.get('DATA_DIR', DEFAULT_DATA_DIR)
     
-    # システムプロンプト
-    system_prompt = """あなたは健康管理をサポートするAIアシスタントです。
-ユーザーの健康記録に基づいて、親切で正確なアドバイスを提供してください。
+    # 構築中に保存された記録の反映が、構築の完了を待てるようにロック内で構築する
+    with _vitals_stores_lock:
+        store = _vitals_stores.get(data_dir)
+        if store is None:
+            store = VitalsStore.from_records(load_health_records(data_dir))
+            _vitals_stores[data_dir] = store
+    return store
 
-IMPORTANT: 必ず日本語で回答してください。英語での回答は絶対に禁止です。
-重要: どのような質問でも、必ず日本語で答えてください。"""
+
+def get_record_index(data_dir=None):
+    """記録ファイル名インデックスを取得する"""
+    if data_dir is None:
+        data_dir = app.config.get('DATA_DIR', DEFAULT_DATA_DIR)
     
-    # 過去の健康記録を取得
-    health_records = load_health_records(data_dir, days, keywords)
+    index = _record_indexes.get(data_dir)
+    if index is None:
+        index = RecordIndex(data_dir)
+        _record_indexes[data_dir] = index
+    return index
+
+
+def update_vitals_store(data_dir, filename):
+    """保存された記録を数値データストアに反映する（バックグラウンドタスク）"""
+    # 構築中なら完了を待つ（構築時のファイル一覧にこの記録が含まれていない場合がある）
+    with _vitals_stores_lock:
+        store = _vitals_stores.get(data_dir)
+    if store is None:
+        # 未構築の場合は初回アクセス時に一括抽出されるので何もしない
+        return
+    
+    with open(os.path.join(data_dir, filename), 'r', encoding='utf-8') as f:
+        store.add_record(json.load(f))
+
+
+def get_task_executor(data_dir=None):
+    """バックグラウンドタスク実行器を取得する（初回は未完了のジョブを再投入する）"""
+    if data_dir is None:
+        data_dir = app.config.get('DATA_DIR', DEFAULT_DATA_DIR)
+    
+    with _task_executors_lock:
+        executor = _task_executors.get(data_dir)
+        if executor is None:
+            executor = TaskExecutor(os.path.join(data_dir, TASK_QUEUE_DIRNAME), max_workers=TASK_WORKERS)
+            executor.register('update_vitals', update_vitals_store)
+            executor.recover()
+            _task_executors[data_dir] = executor
+    return executor
+
+
+def recover_task_executor(data_dir=None):
+    """起動時に前回の未完了ジョブがあれば実行器を作って再実行する（次の保存を待たない）"""
+    if data_dir is None:
+        data_dir = app.config.get('DATA_DIR', DEFAULT_DATA_DIR)
+    
+    # キューディレクトリがなければジョブも残っていないので、何も作らない
+    if not os.path.isdir(os.path.join(data_dir, TASK_QUEUE_DIRNAME)):
+        return None
+    return get_task_executor(data_dir)
+
+
+@atexit.register
+def shutdown_task_executors(timeout=10):
+    """終了時に実行中のタスクを待つ（残ったジョブは次回起動時に再実行される）"""
+    for executor in list(_task_executors.values()):
+        executor.shutdown(timeout=timeout)
+
+
+def create_ollama_payload(message, data_dir=None, days=None, keywords=None, health_records=None):
+    """Ollamaに送信するペイロードを作成する"""
+    # 過去の健康記録を取得（読み込み済みなら再利用する）
+    if health_records is None:
+        health_records = load_health_records(data_dir, days, keywords)
     
     # 文脈として健康記録を追加
     context = ""
     if health_records:
-        context = "\n\n過去の健康記録:\n"
-        for record in health_records[:]:
-            context += f"- {record.get('timestamp', '')}: {record.get('health_record', '')}\n"
+        # 記録から抽出した数値のサマリーを先頭に付ける
+        summary = VitalsStore.from_records(health_records).summary_text()
+        if summary:
+            context += "\n\n数値サマリー:\n" + summary
+        # 日付ごとにまとめ、同じ内容の繰り返しを省略してトークン数を減らす
+        encoded, encode_stats = encode_context(health_records)
+        context += "\n\n過去の健康記録（日付ごと、時刻 内容）:\n" + encoded
+        print(
+            f"文脈: {encode_stats['records']}件 {encode_stats['encoded_tokens']}トークン"
+            f"（従来形式 {encode_stats['raw_tokens']}トークン、{encode_stats['saved_tokens']}トークン削減）",
+            file=sys.stderr
+        )
     
     # 完全なプロンプトを作成
-    full_prompt = f"""{system_prompt}{context}
+    full_prompt = f"""{SYSTEM_PROMPT}{context}
 
 ユーザーの質問: {message}
 
 回答は必ず日本語で行ってください。Answer in Japanese only."""
     
+    return build_ollama_payload(full_prompt, classify_question(message))
+
+
+def build_ollama_payload(prompt, question_type='default'):
+    """プロンプトからOllamaの /api/generate に送るペイロードを作る
+
+    num_ctx はプロンプトの長さから段階的な候補の中で選び、num_predict は質問の種類で上限を決める。
+    """
+    ollama_config = get_ollama_config()
+    options, prompt_tokens = choose_options(
+        prompt, question_type, OLLAMA_MODEL_OPTIONS.get(ollama_config['model'])
+    )
+    print(
+        f"Ollamaオプション: プロンプト{prompt_tokens}トークン 種類={question_type} "
+        f"{' '.join(f'{key}={value}' for key, value in sorted(options.items()))}",
+        file=sys.stderr
+    )
     return {
         'model': ollama_config['model'],
-        'prompt': full_prompt,
-        'stream': False
+        'prompt': prompt,
+        'stream': False,
+        'options': options
     }
 
 
+def post_to_ollama(payload):
+    """ペイロードをOllamaに送り、応答のJSONを返す（所要時間を options と一緒に記録する）"""
+    ollama_config = get_ollama_config()
+    started = time.perf_counter()
+    response = requests.post(ollama_config['url'], json=payload)
+    response.raise_for_status()
+    result = response.json()
+    options = payload.get('options', {})
+    print(
+        f"Ollama応答: {time.perf_counter() - started:.2f}秒 num_ctx={options.get('num_ctx')} "
+        f"num_predict={options.get('num_predict')} prompt_eval_count={result.get('prompt_eval_count')} "
+        f"eval_count={result.get('eval_count')}",
+        file=sys.stderr
+    )
+    return result
+
+
+def generate_with_ollama(prompt, question_type='default'):
+    """プロンプトをOllamaに送り、応答テキストを返す（接続エラーは例外として送出する）"""
+    result = post_to_ollama(build_ollama_payload(prompt, question_type))
+    return result.get('response', 'AIからの応答を取得できませんでした。')
+
+
+# 長期間モードのチャットジョブ（ジョブID -> 進捗と結果）
+_chat_jobs = {}
+_chat_jobs_lock = threading.Lock()
+
+# 保持しておく完了済みジョブの数
+CHAT_JOBS_KEEP = 50
+
+# 長期間モードのOllama呼び出しの同時実行数（すべてのジョブで共有する）
+_long_query_slots = threading.BoundedSemaphore(max(LONG_QUERY_PARALLELISM, 1))
+
+
+def start_long_query_job(message, health_records):
+    """長期間の記録に対する質問を分割・並列で処理するジョブを開始し、ジョブIDを返す"""
+    job_id = uuid.uuid4().hex
+    job = {'status': 'running', 'stage': 'map', 'completed': 0, 'total': 0, 'answer': None}
+    with _chat_jobs_lock:
+        # 古い完了済みジョブを捨てる
+        finished = [key for key, value in _chat_jobs.items() if value['status'] != 'running']
+        for key in finished[:max(len(finished) - CHAT_JOBS_KEEP + 1, 0)]:
+            del _chat_jobs[key]
+        _chat_jobs[job_id] = job
+    
+    def on_progress(completed, total, stage):
+        job.update(completed=completed, total=total, stage=stage)
+    
+    # 期間ごとの分析は短く、統合の回答は質問の種類に合わせた長さにする
+    reduce_type = classify_question(message)
+    
+    def generate(prompt, stage):
+        # 同時に複数のジョブが走っても、Ollamaへの呼び出しは全体で LONG_QUERY_PARALLELISM 件まで
+        with _long_query_slots:
+            return generate_with_ollama(prompt, 'partial' if stage == 'map' else reduce_type)
+    
+    def run():
+        # スレッド内の例外はどこにも伝わらないので、何が起きても必ずジョブを終わらせる
+        try:
+            summary = VitalsStore.from_records(health_records).summary_text()
+            ai_response = map_reduce_answer(
+                message, health_records, generate, SYSTEM_PROMPT,
+                max_tokens=CONTEXT_TOKEN_BUDGET, parallelism=LONG_QUERY_PARALLELISM,
+                summary=summary, on_progress=on_progress
+            )
+            job.update(status='done', answer=convert_markdown(ai_response))
+        except Exception as e:
+            print(f'{e=}', file=sys.stderr)
+            job.update(status='error', answer=convert_markdown("AIサービスに接続できませんでした。"))
+    
+    threading.Thread(target=run, daemon=True).start()
+    return job_id
+
+
 @app.route('/', methods=['GET'])
 def show_form():
     latest_time = get_latest_health_record_time()
@@ -184,19 +389,20 @@ def chat_with_ai():
     if not keywords.strip():
         keywords = None
     
-    # Ollama設定を取得
-    ollama_config = get_ollama_config()
-    
-    # フィルタリングパラメータを使ってペイロードを作成
+    # フィルタリングパラメータに合う記録を読み込む
     data_dir = app.config.get('DATA_DIR', DEFAULT_DATA_DIR)
-    payload = create_ollama_payload(message, data_dir=data_dir, days=days, keywords=keywords)
+    health_records = load_health_records(data_dir, days, keywords)
+    
+    # 1回の呼び出しに収まらない量なら、分割して並列に問い合わせる長期間モードにする
+    if len(chunk_records(health_records, CONTEXT_TOKEN_BUDGET)) > 1:
+        job_id = start_long_query_job(message, health_records)
+        return render_template('chat.html', user_message=message, job_id=job_id)
+    
+    payload = create_ollama_payload(message, health_records=health_records)
     
     # Ollama APIにリクエスト送信
     try:
-        response = requests.post(ollama_config['url'], json=payload)
-        response.raise_for_status()
-        
-        ai_response = response.json().get('response', 'AIからの応答を取得できませんでした。')
+        ai_response = post_to_ollama(payload).get('response', 'AIからの応答を取得できませんでした。')
         
     except requests.exceptions.RequestException as e:
         print(f'{e=}', file=sys.stderr)
@@ -209,6 +415,120 @@ def chat_with_ai():
     return render_template('chat.html', user_message=message, ai_response=ai_response_html)
 
 
+@app.route('/api/chat/jobs/<job_id>', methods=['GET'])
+def get_chat_job(job_id):
+    job = _chat_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'ジョブが見つかりません'}), 404
+    return jsonify(job)
+
+
+def get_records_page(args):
+    """クエリパラメータ（before / after / limit）に従って記録の1ページ分を取得する"""
+    import re
+    
+    limit = args.get('limit', default=20, type=int)
+    limit = min(max(limit, 1), RECORDS_PAGE_LIMIT_MAX)
+    before = args.get('before') or None
+    after = args.get('after') or None
+    
+    # カーソルはファイル名のタイムスタンプ部分（YYYYMMDD_HHMMSS）
+    for cursor in (before, after):
+        if cursor is not None and not re.match(r'^\d{8}_\d{6}$', cursor):
+            raise ValueError(f'不正なカーソルです: {cursor}')
+    
+    return get_record_index().load_page(before=before, after=after, limit=limit)
+
+
+@app.route('/records', methods=['GET'])
+def show_records():
+    try:
+        page = get_records_page(request.args)
+    except ValueError:
+        return redirect(url_for('show_records'))
+    return render_template('records.html', page=page)
+
+
+@app.route('/api/records', methods=['GET'])
+def list_records():
+    try:
+        return jsonify(get_records_page(request.args))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    # 集計期間（日数）、対象項目、移動平均の件数と返す点数を取得
+    days = request.args.get('days', type=int)
+    window = request.args.get('window', default=7, type=int)
+    limit = request.args.get('limit', default=STATS_MOVING_AVERAGE_LIMIT_DEFAULT, type=int)
+    limit = min(max(limit, 0), STATS_MOVING_AVERAGE_LIMIT_MAX)
+    fields_str = request.args.get('fields', '')
+    
+    fields = [field.strip() for field in fields_str.split(',') if field.strip()] or list(VITAL_FIELDS)
+    unknown = [field for field in fields if field not in VITAL_FIELDS]
+    if unknown:
+        return jsonify({'error': f"不明な項目です: {', '.join(unknown)}"}), 400
+    
+    start = None
+    if days is not None:
+        from datetime import timedelta
+        start = datetime.now() - timedelta(days=days)
+    
+    store = get_vitals_store()
+    return jsonify({
+        'days': days,
+        'window': window,
+        'limit': limit,
+        'stats': store.stats(start=start, fields=fields, window=window, limit=limit)
+    })
+
+
+@app.route('/api/export', methods=['GET'])
+def export_health_records():
+    # 形式（ndjson / gzip / zip）、期間（YYYY-MM-DD）、キーワードを取得
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f'不明なエクスポート形式です: {export_format}'}), 400
+    
+    try:
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d') if request.args.get('start') else None
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d') if request.args.get('end') else None
+    except ValueError:
+        return jsonify({'error': '日付は YYYY-MM-DD 形式で指定してください'}), 400
+    keywords = request.args.get('keywords') or None
+    
+    # 記録を1件ずつ読みながら送信するので、履歴の量によらずメモリ使用量は一定
+    data_dir = app.config.get('DATA_DIR', DEFAULT_DATA_DIR)
+    chunks = export_records(data_dir, export_format, start, end, keywords)
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    filename = f"health_records_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+
+@app.route('/api/import', methods=['POST'])
+def import_health_records():
+    # アップロードされたファイル、またはリクエストボディをそのまま読み込む
+    upload = request.files.get('file')
+    stream = upload.stream if upload else request.stream
+    overwrite = request.args.get('overwrite') == '1'
+    
+    data_dir = app.config.get('DATA_DIR', DEFAULT_DATA_DIR)
+    result = import_records(data_dir, stream, overwrite=overwrite)
+    
+    # 取り込んだ記録を含めて次回アクセス時に再構築させる
+    with _vitals_stores_lock:
+        _vitals_stores.pop(data_dir, None)
+    _record_indexes.pop(data_dir, None)
+    
+    return jsonify(result)
+
+
 @app.route('/', methods=['POST'])
 def save_health_record():
     health_record = request.form['health_record']
@@ -234,10 +554,22 @@ def save_health_record():
     with open(filepath, 'w', encoding='utf-8') as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
     
+    # 一覧表示用のインデックスに加える（構築済みの場合のみ）
+    index = _record_indexes.get(data_dir)
+    if index is not None:
+        index.add(filename)
+    
+    # 保存後の処理はバックグラウンドで実行し、レスポンスを待たせない
+    get_task_executor(data_dir).submit('update_vitals', data_dir=data_dir, filename=filename)
+    
     # PRGパターン: POST後はチャットページにリダイレクト
     return redirect(url_for('show_chat'))
 
 
+# 設定されたデータディレクトリに残っているジョブは起動時に再実行する
+recover_task_executor(DEFAULT_DATA_DIR)
+
+
 if __name__ == '__main__':
     # 環境変数からポートを取得、デフォルトは5000（開発時）
     port = int(os.getenv('PORT', '5000'))
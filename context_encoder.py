@@ -0,0 +1,115 @@
+import re
+import unicodedata
+from datetime import datetime, timedelta
+
+
+def estimate_tokens(text):
+    """プロンプトのおおよそのトークン数（英数字は単語ごと、それ以外は1文字1トークン）"""
+    tokens = 0
+    in_word = False
+    for ch in text:
+        if ch.isascii() and ch.isalnum():
+            if not in_word:
+                tokens += 1
+                in_word = True
+        else:
+            in_word = False
+            if not ch.isspace():
+                tokens += 1
+    return tokens
+
+
+def normalize_text(text):
+    """記録本文を1行に整える（全角英数字の半角化、空白の圧縮、改行は「 / 」で連結）"""
+    text = unicodedata.normalize('NFKC', text or '')
+    lines = [re.sub(r'\s+', ' ', line).strip() for line in text.splitlines()]
+    return ' / '.join(line for line in lines if line)
+
+
+def _dedup_key(text):
+    """ほぼ同じ内容かどうかを判定するためのキー（空白と句読点の違いは無視する）"""
+    return re.sub(r'[\s、。,.・/]+', '', text)
+
+
+def _time_slot(timestamp):
+    """連続判定に使う大まかな時間帯（朝・昼・夜）
+
+    毎日の記録は数分ずれるのが普通なので、時刻そのものではなく時間帯で比べる。
+    """
+    if 4 <= timestamp.hour < 11:
+        return '朝'
+    if 11 <= timestamp.hour < 17:
+        return '昼'
+    return '夜'
+
+
+def raw_context(records):
+    """従来形式の文脈（1記録1行、タイムスタンプをそのまま出力）"""
+    return ''.join(
+        f"- {record.get('timestamp', '')}: {record.get('health_record', '')}\n" for record in records
+    )
+
+
+def encode_context(records):
+    """健康記録をトークン数の少ない文脈テキストに変換する
+
+    日付ごとにまとめて時刻だけを表示し、前日の同じ時間帯（朝・昼・夜）と同じ内容が
+    続く記録は最初の1件に「同じ内容がN日間続く」と注記して省略する。
+    タイムスタンプがない・読めない記録は捨てずに末尾の「[日時不明]」にまとめる。
+    戻り値は (文脈テキスト, 統計情報)。
+    """
+    entries = []
+    undated = []
+    for record in records:
+        text = normalize_text(record.get('health_record', ''))
+        try:
+            timestamp = datetime.fromisoformat(record['timestamp'])
+        except (KeyError, TypeError, ValueError):
+            # 読めなかったタイムスタンプも手がかりになるので、元の文字列があれば残す
+            raw_timestamp = str(record.get('timestamp') or '').strip()
+            undated.append(f'{raw_timestamp} {text}' if raw_timestamp else text)
+            continue
+        entries.append((timestamp, text))
+    entries.sort(key=lambda entry: entry[0])
+
+    # 日付ごとの行（[時刻ラベル, 本文, 連続日数, 最後の日付]）
+    days = {}
+    # (時間帯, 内容) ごとの直前の行（連続判定用）
+    last_by_slot = {}
+    for timestamp, text in entries:
+        date = timestamp.date()
+        label = timestamp.strftime('%H:%M')
+        slot = (_time_slot(timestamp), _dedup_key(text))
+
+        previous = last_by_slot.get(slot)
+        if previous is not None and previous['last_date'] == date - timedelta(days=1):
+            previous['days'] += 1
+            previous['last_date'] = date
+            continue
+
+        line = {'label': label, 'text': text, 'days': 1, 'last_date': date}
+        days.setdefault(date, []).append(line)
+        last_by_slot[slot] = line
+
+    output = []
+    for date in sorted(days):
+        output.append(f'[{date.isoformat()}]')
+        for line in days[date]:
+            note = ''
+            if line['days'] > 1:
+                note = f" (同じ内容が{line['last_date'].month}/{line['last_date'].day}まで{line['days']}日間続く)"
+            output.append(f"{line['label']} {line['text']}{note}")
+    if undated:
+        output.append('[日時不明]')
+        output.extend(undated)
+    encoded = '\n'.join(output) + '\n' if output else ''
+
+    raw_tokens = estimate_tokens(raw_context(records))
+    encoded_tokens = estimate_tokens(encoded)
+    stats = {
+        'records': len(entries) + len(undated),
+        'raw_tokens': raw_tokens,
+        'encoded_tokens': encoded_tokens,
+        'saved_tokens': raw_tokens - encoded_tokens,
+    }
+    return encoded, stats
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+負荷試験ツール（Ollamaの代わりに動くローカルのフェイクサーバー付き）
+
+使い方:
+    # フェイクOllamaだけを起動する（アプリの OLLAMA_URL をこちらに向ける）
+    python loadtest.py fake-ollama --ollama-port 11435 --decode-ms 20 --max-concurrency 1
+
+    # 起動済みのアプリに負荷をかける
+    python loadtest.py drive --url http://localhost:5000 --users 8 --iterations 10
+
+    # フェイクOllamaとアプリをこのプロセス内で起動し、負荷をかけて結果を出す
+    python loadtest.py run --users 8 --iterations 10 --prefill-ms 0.5 --decode-ms 20
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from context_encoder import estimate_tokens
+
+
+# 負荷試験で保存する記録と質問の例
+SAMPLE_RECORDS = [
+    "体重: 70.2kg\n血圧: 121/79\n脈拍: 64\n調子: 良好",
+    "今日は7時間寝た。朝のランニング30分。気分は普通。8,200歩",
+    "頭痛がひどい。昨夜2時まで起きてた。コーヒー3杯",
+    "体重: 70.8kg 血圧: 128/84 少し寝不足",
+]
+# アプリがOllamaに接続できなかったときにチャットページへ表示するメッセージ
+CHAT_ERROR_MESSAGE = 'AIサービスに接続できませんでした。'
+# 長期間モードのチャットはジョブIDだけを返すので、完了するまで進捗APIを問い合わせる
+JOB_ID_PATTERN = re.compile(r'data-job-id="([^"]+)"')
+JOB_POLL_INTERVAL = 0.2
+
+SAMPLE_QUESTIONS = [
+    "最近の体重の傾向を教えて",
+    "血圧は安定していますか？",
+    "睡眠について何かアドバイスはありますか？",
+]
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    """Ollamaの /api/generate を模したHTTPサーバー
+
+    プロンプトのトークン数に比例したprefill時間と、出力1トークンごとのdecode時間を待ってから応答する。
+    同時に処理する数は max_concurrency に制限され、超えた分は順番待ちになる。
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, prefill_ms=0.5, decode_ms=20.0, response_tokens=64,
+                 max_concurrency=1, failure_rate=0.0, seed=None):
+        super().__init__(address, FakeOllamaHandler)
+        self.prefill_ms = prefill_ms
+        self.decode_ms = decode_ms
+        self.response_tokens = response_tokens
+        self.failure_rate = failure_rate
+        self.slots = threading.Semaphore(max_concurrency)
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/api/generate'
+
+    def should_fail(self):
+        with self.random_lock:
+            return self.random.random() < self.failure_rate
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        # 負荷試験中のアクセスログは出さない
+        pass
+
+    def do_POST(self):
+        if self.path != '/api/generate':
+            self._send_json(404, {'error': 'not found'})
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError:
+            self._send_json(400, {'error': 'invalid json'})
+            return
+
+        server = self.server
+        if server.should_fail():
+            self._send_json(500, {'error': 'injected failure'})
+            return
+
+        prompt_tokens = estimate_tokens(payload.get('prompt', ''))
+        options = payload.get('options') or {}
+        eval_tokens = min(server.response_tokens, options.get('num_predict', server.response_tokens))
+        if eval_tokens < 0:
+            eval_tokens = server.response_tokens
+
+        with server.slots:
+            started = time.perf_counter()
+            time.sleep(prompt_tokens * server.prefill_ms / 1000)
+            prompt_eval_duration = time.perf_counter() - started
+
+            if payload.get('stream', True):
+                self._stream_response(payload, prompt_tokens, eval_tokens, started, prompt_eval_duration)
+            else:
+                time.sleep(eval_tokens * server.decode_ms / 1000)
+                self._send_json(200, self._final_chunk(payload, prompt_tokens, eval_tokens, started,
+                                                       prompt_eval_duration, response='テスト応答。' * max(eval_tokens // 6, 1)))
+
+    def _stream_response(self, payload, prompt_tokens, eval_tokens, started, prompt_eval_duration):
+        server = self.server
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for _ in range(eval_tokens):
+            time.sleep(server.decode_ms / 1000)
+            self._write_chunk({'model': payload.get('model'), 'response': 'テ', 'done': False})
+        self._write_chunk(self._final_chunk(payload, prompt_tokens, eval_tokens, started,
+                                            prompt_eval_duration, response=''))
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _final_chunk(self, payload, prompt_tokens, eval_tokens, started, prompt_eval_duration, response):
+        total = time.perf_counter() - started
+        return {
+            'model': payload.get('model'),
+            'response': response,
+            'done': True,
+            'prompt_eval_count': prompt_tokens,
+            'eval_count': eval_tokens,
+            'prompt_eval_duration': int(prompt_eval_duration * 1e9),
+            'total_duration': int(total * 1e9),
+        }
+
+    def _write_chunk(self, data):
+        body = (json.dumps(data, ensure_ascii=False) + '\n').encode('utf-8')
+        self.wfile.write(f'{len(body):x}\r\n'.encode('ascii') + body + b'\r\n')
+        self.wfile.flush()
+
+    def _send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_in_thread(server):
+    """サーバーをデーモンスレッドで起動する"""
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return thread
+
+
+def percentile(values, p):
+    """線形補間によるパーセンタイル（values はソート済み）"""
+    if not values:
+        return None
+    position = (len(values) - 1) * p / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+class LoadDriver:
+    """N人の利用者が「記録を保存してからチャットする」操作を繰り返す負荷ドライバ"""
+
+    def __init__(self, base_url, users=4, iterations=5, think_time=0.0, seed=None):
+        self.base_url = base_url.rstrip('/')
+        self.users = users
+        self.iterations = iterations
+        self.think_time = think_time
+        self.seed = seed
+        self.samples = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def run(self):
+        """負荷をかけ、エンドポイントごとの集計結果を返す"""
+        threads = [threading.Thread(target=self._user, args=(index,)) for index in range(self.users)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.report(time.perf_counter() - started)
+
+    def _user(self, index):
+        rng = random.Random(None if self.seed is None else self.seed + index)
+        session = requests.Session()
+        for _ in range(self.iterations):
+            self._request(session, 'POST /', 'post', '/',
+                          data={'health_record': rng.choice(SAMPLE_RECORDS)}, allow_redirects=False)
+            self._request(session, 'POST /chat', 'post', '/chat',
+                          data={'message': rng.choice(SAMPLE_QUESTIONS), 'days': '7'},
+                          error_marker=CHAT_ERROR_MESSAGE)
+            if self.think_time:
+                time.sleep(rng.uniform(0, self.think_time))
+
+    def _request(self, session, name, method, path, error_marker=None, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = session.request(method, self.base_url + path, timeout=300, **kwargs)
+            # チャットはOllamaのエラーでも200を返すので、本文のエラーメッセージで判定する
+            ok = response.status_code < 400 and not (error_marker and error_marker in response.text)
+            match = JOB_ID_PATTERN.search(response.text) if ok else None
+            if match:
+                ok = self._wait_for_job(session, match.group(1))
+        except requests.exceptions.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.samples.setdefault(name, []).append(elapsed)
+            if not ok:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+    def _wait_for_job(self, session, job_id, timeout=300):
+        """長期間モードのジョブが終わるまで待ち、回答が得られたかを返す"""
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            response = session.get(f'{self.base_url}/api/chat/jobs/{job_id}', timeout=30)
+            if response.status_code >= 400:
+                return False
+            status = response.json().get('status')
+            if status != 'running':
+                return status == 'done'
+            time.sleep(JOB_POLL_INTERVAL)
+        return False
+
+    def report(self, duration):
+        result = {'duration': round(duration, 3), 'users': self.users, 'endpoints': {}}
+        for name, samples in sorted(self.samples.items()):
+            samples = sorted(samples)
+            result['endpoints'][name] = {
+                'count': len(samples),
+                'errors': self.errors.get(name, 0),
+                'throughput': round(len(samples) / duration, 2) if duration > 0 else None,
+                'p50_ms': round(percentile(samples, 50) * 1000, 1),
+                'p95_ms': round(percentile(samples, 95) * 1000, 1),
+                'p99_ms': round(percentile(samples, 99) * 1000, 1),
+            }
+        return result
+
+
+def format_report(result):
+    """集計結果を表形式の文字列にする"""
+    lines = [
+        f"利用者数: {result['users']}  所要時間: {result['duration']:.2f}s",
+        f"{'endpoint':<12}{'count':>7}{'errors':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}",
+    ]
+    for name, stat in result['endpoints'].items():
+        lines.append(
+            f"{name:<12}{stat['count']:>7}{stat['errors']:>8}{stat['throughput']:>9}"
+            f"{stat['p50_ms']:>10}{stat['p95_ms']:>10}{stat['p99_ms']:>10}"
+        )
+    return '\n'.join(lines)
+
+
+def _fake_server_from_args(args):
+    return FakeOllamaServer(
+        (args.host, args.ollama_port),
+        prefill_ms=args.prefill_ms,
+        decode_ms=args.decode_ms,
+        response_tokens=args.response_tokens,
+        max_concurrency=args.max_concurrency,
+        failure_rate=args.failure_rate,
+        seed=args.seed,
+    )
+
+
+def _print_result(result, as_json):
+    if as_json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        print(format_report(result))
+
+
+def run_self_contained(args):
+    """フェイクOllamaとアプリを起動して負荷をかける（一時ディレクトリに記録を保存する）"""
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    class QuietRequestHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    fake = _fake_server_from_args(args)
+    start_in_thread(fake)
+
+    # app は読み込み時に OLLAMA_URL を必要とするので先に設定しておく
+    os.environ.setdefault('OLLAMA_URL', fake.url)
+    import app as app_module
+    app_module.OLLAMA_URL = fake.url
+
+    data_dir = tempfile.mkdtemp()
+    app_module.app.config['DATA_DIR'] = data_dir
+    app_server = make_server(args.host, args.app_port, app_module.app, threaded=True,
+                             request_handler=QuietRequestHandler)
+    start_in_thread(app_server)
+    try:
+        host, port = app_server.server_address[:2]
+        driver = LoadDriver(f'http://{host}:{port}', args.users, args.iterations, args.think_time, args.seed)
+        return driver.run()
+    finally:
+        app_server.shutdown()
+        fake.shutdown()
+        executor = app_module._task_executors.get(data_dir)
+        if executor is not None:
+            executor.shutdown(timeout=10)
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='健康記録アプリの負荷試験')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_fake_options(subparser):
+        subparser.add_argument('--host', default='127.0.0.1')
+        subparser.add_argument('--ollama-port', type=int, default=0, help='フェイクOllamaのポート（0で自動）')
+        subparser.add_argument('--prefill-ms', type=float, default=0.5, help='プロンプト1トークンあたりの処理時間')
+        subparser.add_argument('--decode-ms', type=float, default=20.0, help='出力1トークンあたりの生成時間')
+        subparser.add_argument('--response-tokens', type=int, default=64, help='応答のトークン数')
+        subparser.add_argument('--max-concurrency', type=int, default=1, help='同時に処理する要求数')
+        subparser.add_argument('--failure-rate', type=float, default=0.0, help='エラーを返す確率 (0-1)')
+        subparser.add_argument('--seed', type=int, help='乱数シード（再現性のため）')
+
+    def add_driver_options(subparser):
+        subparser.add_argument('--users', type=int, default=4, help='同時利用者数')
+        subparser.add_argument('--iterations', type=int, default=5, help='利用者1人あたりの繰り返し回数')
+        subparser.add_argument('--think-time', type=float, default=0.0, help='操作間の最大待ち時間（秒）')
+        subparser.add_argument('--json', action='store_true', help='結果をJSONで出力する')
+
+    fake_parser = subparsers.add_parser('fake-ollama', help='フェイクOllamaサーバーを起動する')
+    add_fake_options(fake_parser)
+    fake_parser.set_defaults(ollama_port=11435)
+
+    drive_parser = subparsers.add_parser('drive', help='起動済みのアプリに負荷をかける')
+    drive_parser.add_argument('--url', default='http://localhost:5000', help='アプリのURL')
+    drive_parser.add_argument('--seed', type=int, help='乱数シード（再現性のため）')
+    add_driver_options(drive_parser)
+
+    run_parser = subparsers.add_parser('run', help='フェイクOllamaとアプリを起動して負荷をかける')
+    add_fake_options(run_parser)
+    add_driver_options(run_parser)
+    run_parser.add_argument('--app-port', type=int, default=0, help='アプリのポート（0で自動）')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'fake-ollama':
+        server = _fake_server_from_args(args)
+        print(f'フェイクOllama: {server.url}', file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    if args.command == 'drive':
+        driver = LoadDriver(args.url, args.users, args.iterations, args.think_time, args.seed)
+        _print_result(driver.run(), args.json)
+        return 0
+
+    _print_result(run_self_contained(args), args.json)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from context_encoder import encode_context, estimate_tokens, normalize_text
+
+
+# 1件あたりの見積もりに加える、時刻ラベルや日付見出しの分のトークン数
+_RECORD_OVERHEAD_TOKENS = 6
+
+MAP_INSTRUCTION = """以下は長期間の健康記録のうち、{start}〜{end}の部分です。
+この部分の記録だけに基づいて、ユーザーの質問に関係する事実・数値・傾向を箇条書きで簡潔にまとめてください。
+関係する記録がなければ「該当なし」とだけ答えてください。"""
+
+REDUCE_INSTRUCTION = """以下は長期間の健康記録を期間ごとに分析した結果です。
+これらをまとめて、ユーザーの質問に答えてください。期間による変化があれば触れてください。"""
+
+MISSING_PARTIAL = '（この期間の分析は取得できませんでした）'
+
+
+def chunk_records(records, max_tokens):
+    """記録を時刻順に並べ、文脈が max_tokens に収まるように分割する"""
+    def sort_key(record):
+        try:
+            return datetime.fromisoformat(record['timestamp'])
+        except (KeyError, TypeError, ValueError):
+            return datetime.min
+
+    chunks = []
+    current = []
+    current_tokens = 0
+    for record in sorted(records, key=sort_key):
+        tokens = estimate_tokens(normalize_text(record.get('health_record', ''))) + _RECORD_OVERHEAD_TOKENS
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(current)
+            current = []
+            current_tokens = 0
+        current.append(record)
+        current_tokens += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _period(records):
+    """記録の先頭と末尾の日付"""
+    return records[0].get('timestamp', '')[:10], records[-1].get('timestamp', '')[:10]
+
+
+def build_map_prompt(system_prompt, message, records):
+    start, end = _period(records)
+    encoded, _ = encode_context(records)
+    return f"""{system_prompt}
+
+{MAP_INSTRUCTION.format(start=start, end=end)}
+
+健康記録（日付ごと、時刻 内容）:
+{encoded}
+ユーザーの質問: {message}
+
+回答は必ず日本語で行ってください。Answer in Japanese only."""
+
+
+def build_reduce_prompt(system_prompt, message, partials, summary=''):
+    sections = '\n\n'.join(f'### {start}〜{end}\n{text}' for (start, end), text in partials)
+    summary_section = f'\n\n期間全体の数値サマリー:\n{summary}' if summary else ''
+    return f"""{system_prompt}
+
+{REDUCE_INSTRUCTION}{summary_section}
+
+{sections}
+
+ユーザーの質問: {message}
+
+回答は必ず日本語で行ってください。Answer in Japanese only."""
+
+
+def map_reduce_answer(message, records, generate, system_prompt, max_tokens,
+                      parallelism=2, summary='', on_progress=None):
+    """長期間の記録に対する質問を、分割した記録ごとの並列呼び出しと最後の統合呼び出しで答える
+
+    generate は (プロンプト, 段階) を受け取って応答テキストを返す関数。
+    on_progress には (完了数, 全体数, 段階) が渡される。段階は 'map' または 'reduce'。
+    """
+    chunks = chunk_records(records, max_tokens)
+    total = len(chunks) + 1
+    completed = 0
+
+    def report(stage):
+        if on_progress is not None:
+            on_progress(completed, total, stage)
+
+    report('map')
+    partials = [None] * len(chunks)
+    failures = 0
+    with ThreadPoolExecutor(max_workers=max(int(parallelism), 1)) as pool:
+        futures = {
+            pool.submit(generate, build_map_prompt(system_prompt, message, chunk), 'map'): index
+            for index, chunk in enumerate(chunks)
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                text = future.result()
+            except Exception:
+                text = MISSING_PARTIAL
+                failures += 1
+            partials[index] = (_period(chunks[index]), text)
+            completed += 1
+            report('map')
+
+    if chunks and failures == len(chunks):
+        raise RuntimeError('すべての期間の分析に失敗しました')
+
+    report('reduce')
+    answer = generate(build_reduce_prompt(system_prompt, message, partials, summary), 'reduce')
+    completed += 1
+    report('reduce')
+    return answer
@@ -0,0 +1,60 @@
+import re
+
+from context_encoder import estimate_tokens
+
+
+# num_ctx の候補（同じ大きさが繰り返し使われ、Ollama側の確保済みメモリが再利用されるように段階を少なくする）
+NUM_CTX_BUCKETS = (2048, 4096, 8192, 16384, 32768)
+
+# 質問の種類ごとの num_predict の上限
+NUM_PREDICT_BY_TYPE = {
+    'short': 256,      # 数値や日時を聞くだけの質問
+    'default': 512,
+    'analysis': 1024,  # 傾向の分析やアドバイスを求める質問
+    'partial': 384,    # 長期間モードの期間ごとの分析
+}
+
+# トークン数の見積もり誤差に備えた余裕
+_TOKEN_MARGIN = 1.1
+
+# 「いつも」「いつか」「いつでも」は日時を聞く質問ではない
+_SHORT_PATTERN = re.compile(r'(何kg|何キロ|何歩|何回|いくつ|いつ(?!も|か|でも)|何時|最新|最後|前回)')
+_ANALYSIS_PATTERN = re.compile(r'(傾向|推移|変化|分析|比較|アドバイス|改善|原因|理由|なぜ|どうして|どうすれば|まとめ|振り返)')
+# 「前回から体調はどう？」のように自由に答えさせる質問（短い回答の手がかりより優先する）
+_OPEN_PATTERN = re.compile(r'(どう|どんな|様子|具合)')
+
+
+def classify_question(message):
+    """質問文から回答に必要な長さの種類を判定する"""
+    message = message or ''
+    if _ANALYSIS_PATTERN.search(message):
+        return 'analysis'
+    if _OPEN_PATTERN.search(message):
+        return 'default'
+    if _SHORT_PATTERN.search(message):
+        return 'short'
+    return 'default'
+
+
+def choose_num_ctx(required_tokens):
+    """必要なトークン数が収まる最小の num_ctx を選ぶ（収まらなければ最大のもの）"""
+    for bucket in NUM_CTX_BUCKETS:
+        if required_tokens <= bucket:
+            return bucket
+    return NUM_CTX_BUCKETS[-1]
+
+
+def choose_options(prompt, question_type='default', model_options=None):
+    """プロンプトの長さと質問の種類に合わせた Ollama の options を作る
+
+    戻り値は (options, プロンプトの見積もりトークン数)。
+    model_options（num_thread や num_batch など）はそのまま options に加える。
+    """
+    prompt_tokens = estimate_tokens(prompt)
+    num_predict = NUM_PREDICT_BY_TYPE.get(question_type, NUM_PREDICT_BY_TYPE['default'])
+    num_ctx = choose_num_ctx(int(prompt_tokens * _TOKEN_MARGIN) + num_predict)
+
+    options = dict(model_options or {})
+    options['num_ctx'] = num_ctx
+    options['num_predict'] = num_predict
+    return options, prompt_tokens
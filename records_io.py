@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+健康記録のエクスポート・インポート（NDJSON / gzip / zip のストリーミング処理）
+
+使い方:
+    python records_io.py export --format gzip --start 2025-01-01 -o backup.ndjson.gz
+    python records_io.py import backup.ndjson.gz
+"""
+
+import io
+import os
+import re
+import sys
+import json
+import gzip
+import zlib
+import bisect
+import shutil
+import threading
+import zipfile
+import argparse
+import tempfile
+from datetime import datetime
+
+
+RECORD_FILENAME_PATTERN = re.compile(r'^health_record_(\d{8}_\d{6})\.json$')
+
+# エクスポート形式ごとの Content-Type と拡張子
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'gzip': ('application/gzip', 'ndjson.gz'),
+    'zip': ('application/zip', 'zip'),
+}
+
+_GZIP_MAGIC = b'\x1f\x8b'
+_ZIP_MAGIC = b'PK\x03\x04'
+_CHUNK_SIZE = 64 * 1024
+
+
+def parse_keywords(keywords):
+    """キーワード文字列をリストに分割する（コンマがあればコンマ区切り、なければスペース区切り）"""
+    if keywords is None or not keywords.strip():
+        return []
+    if ',' in keywords:
+        keyword_list = [kw.strip() for kw in keywords.split(',')]
+    else:
+        keyword_list = keywords.split()
+    return [kw for kw in keyword_list if kw]
+
+
+def record_filename(record):
+    """記録のタイムスタンプから保存用のファイル名を作る"""
+    timestamp = datetime.fromisoformat(record['timestamp'])
+    return f"health_record_{timestamp.strftime('%Y%m%d_%H%M%S')}.json"
+
+
+def iter_record_files(data_dir, start=None, end=None):
+    """記録ファイルを時刻順に (ファイル名, 記録) で1件ずつ返す
+
+    start / end（date または datetime）による絞り込みはファイル名だけで行い、
+    範囲外のファイルは開かない。
+    """
+    if not os.path.exists(data_dir):
+        return
+
+    start_key = start.strftime('%Y%m%d') if start is not None else None
+    end_key = end.strftime('%Y%m%d') if end is not None else None
+
+    filenames = []
+    for entry in os.scandir(data_dir):
+        match = RECORD_FILENAME_PATTERN.match(entry.name)
+        if not match:
+            continue
+        date_key = match.group(1)[:8]
+        if start_key is not None and date_key < start_key:
+            continue
+        if end_key is not None and date_key > end_key:
+            continue
+        filenames.append(entry.name)
+
+    for filename in sorted(filenames):
+        try:
+            with open(os.path.join(data_dir, filename), 'r', encoding='utf-8') as f:
+                yield filename, json.load(f)
+        except (json.JSONDecodeError, FileNotFoundError):
+            continue
+
+
+def iter_records(data_dir, start=None, end=None, keywords=None):
+    """期間・キーワードで絞り込んだ記録を時刻順に1件ずつ返す"""
+    keyword_list = parse_keywords(keywords)
+    for filename, record in iter_record_files(data_dir, start, end):
+        if keyword_list and not any(kw in record.get('health_record', '') for kw in keyword_list):
+            continue
+        yield filename, record
+
+
+class RecordIndex:
+    """記録ファイル名（タイムスタンプ）のソート済みインデックス
+
+    ディレクトリの更新時刻が変わったときだけファイル名を読み直すので、
+    ページ表示のたびに全ファイルを開いたり一覧を取り直したりしない。
+    カーソルにはファイル名のタイムスタンプ部分（YYYYMMDD_HHMMSS）を使う。
+    """
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self._keys = []
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """ディレクトリが更新されていればインデックスを作り直す"""
+        try:
+            mtime = os.stat(self.data_dir).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            keys = []
+            if mtime is not None:
+                for entry in os.scandir(self.data_dir):
+                    match = RECORD_FILENAME_PATTERN.match(entry.name)
+                    if match:
+                        keys.append(match.group(1))
+            keys.sort()
+            self._keys = keys
+            self._mtime = mtime
+
+    def add(self, filename):
+        """保存したファイルをインデックスに加える
+
+        ディレクトリの更新時刻も取り込み直すので、次の refresh() で全件を読み直さない。
+        まだ一度も読み込んでいない場合は何もせず、refresh() に任せる。
+        """
+        match = RECORD_FILENAME_PATTERN.match(filename)
+        if not match:
+            return
+        key = match.group(1)
+        try:
+            mtime = os.stat(self.data_dir).st_mtime_ns
+        except FileNotFoundError:
+            return
+        with self._lock:
+            if self._mtime is None:
+                return
+            index = bisect.bisect_left(self._keys, key)
+            if index == len(self._keys) or self._keys[index] != key:
+                self._keys.insert(index, key)
+            self._mtime = mtime
+
+    def __len__(self):
+        return len(self._keys)
+
+    def page(self, before=None, after=None, limit=20):
+        """カーソル位置から limit 件分のキーを新しい順に返す
+
+        before を指定するとそれより古い記録、after を指定するとそれより新しい記録のうち
+        カーソルに近いものを返す。どちらもなければ最新の記録から返す。
+        戻り値は (キーのリスト, より古い記録があるか, より新しい記録があるか)。
+        """
+        self.refresh()
+        with self._lock:
+            keys = self._keys
+            if after is not None:
+                lo = bisect.bisect_right(keys, after)
+                hi = min(lo + limit, len(keys))
+            else:
+                hi = len(keys) if before is None else bisect.bisect_left(keys, before)
+                lo = max(hi - limit, 0)
+            page_keys = keys[lo:hi][::-1]
+            return page_keys, lo > 0, hi < len(keys)
+
+    def load_page(self, before=None, after=None, limit=20):
+        """ページに含まれる記録だけを読み込んで返す"""
+        page_keys, has_older, has_newer = self.page(before, after, limit)
+        records = []
+        for key in page_keys:
+            try:
+                with open(os.path.join(self.data_dir, f'health_record_{key}.json'), 'r', encoding='utf-8') as f:
+                    record = json.load(f)
+            except (json.JSONDecodeError, FileNotFoundError):
+                continue
+            record['id'] = key
+            records.append(record)
+        return {
+            'records': records,
+            'next_cursor': page_keys[-1] if page_keys and has_older else None,
+            'prev_cursor': page_keys[0] if page_keys and has_newer else None,
+        }
+
+
+def export_ndjson(records):
+    """記録をNDJSONの行として返す"""
+    for _, record in records:
+        yield (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+
+
+def export_gzip(records):
+    """NDJSONをgzip圧縮したチャンクを返す"""
+    compressor = zlib.compressobj(wbits=31)  # 31 = gzipヘッダ付き
+    buffered = 0
+    for line in export_ndjson(records):
+        chunk = compressor.compress(line)
+        buffered += len(line)
+        if chunk:
+            yield chunk
+        # 出力が溜まりすぎないよう定期的に吐き出す
+        if buffered >= _CHUNK_SIZE:
+            yield compressor.flush(zlib.Z_SYNC_FLUSH)
+            buffered = 0
+    yield compressor.flush()
+
+
+class _ChunkWriter(io.RawIOBase):
+    """zipfileの書き込み先として使う、シーク不可の出力バッファ"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def export_zip(records):
+    """記録を1件1ファイルのzipアーカイブとして、エントリごとに返す"""
+    writer = _ChunkWriter()
+    with zipfile.ZipFile(writer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for filename, record in records:
+            archive.writestr(filename, json.dumps(record, ensure_ascii=False, indent=2))
+            data = writer.drain()
+            if data:
+                yield data
+    yield writer.drain()
+
+
+def export_records(data_dir, export_format='ndjson', start=None, end=None, keywords=None):
+    """指定した形式でエクスポートデータを1チャンクずつ返す"""
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f'不明なエクスポート形式です: {export_format}')
+    records = iter_records(data_dir, start, end, keywords)
+    if export_format == 'gzip':
+        return export_gzip(records)
+    if export_format == 'zip':
+        return export_zip(records)
+    return export_ndjson(records)
+
+
+class _RawReader(io.RawIOBase):
+    """read() しか持たない入力（WSGIの入力など）をBufferedReaderで包むためのアダプタ"""
+
+    def __init__(self, raw):
+        self._raw = raw
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._raw.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def _iter_import_records(stream):
+    """入力ストリームの形式を判定し、記録を1件ずつ返す（読み取れない行は None）"""
+    if not hasattr(stream, 'peek'):
+        stream = io.BufferedReader(_RawReader(stream), _CHUNK_SIZE)
+    head = stream.peek(4)[:4]
+
+    if head.startswith(_ZIP_MAGIC):
+        # zipは末尾の目次が必要なので、一時ファイルに退避してから読む
+        with tempfile.TemporaryFile() as spooled:
+            shutil.copyfileobj(stream, spooled, _CHUNK_SIZE)
+            spooled.seek(0)
+            with zipfile.ZipFile(spooled) as archive:
+                for name in archive.namelist():
+                    if name.endswith('/'):
+                        continue
+                    with archive.open(name) as f:
+                        yield _loads(f.read())
+        return
+
+    if head.startswith(_GZIP_MAGIC):
+        stream = gzip.GzipFile(fileobj=stream)
+
+    for line in stream:
+        if line.strip():
+            yield _loads(line)
+
+
+def _loads(data):
+    try:
+        return json.loads(data.decode('utf-8'))
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+
+
+def import_records(data_dir, stream, overwrite=False):
+    """エクスポートデータ（NDJSON / gzip / zip）を読み込んで記録ファイルとして保存する
+
+    既存の記録と同じファイル名になるものは overwrite=True でなければスキップする。
+    本文が文字列でない記録や、タイムゾーン付きのタイムスタンプを持つ記録は invalid として数える
+    （保存済みの記録はすべてローカル時刻のタイムゾーンなしで、比較や並べ替えがずれるため）。
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    result = {'imported': 0, 'skipped': 0, 'invalid': 0}
+
+    for record in _iter_import_records(stream):
+        try:
+            data = {
+                'health_record': record['health_record'],
+                'timestamp': record['timestamp'],
+            }
+            if not isinstance(data['health_record'], str):
+                raise TypeError('health_record が文字列ではありません')
+            if datetime.fromisoformat(data['timestamp']).tzinfo is not None:
+                raise ValueError('timestamp にタイムゾーンが含まれています')
+            filepath = os.path.join(data_dir, record_filename(data))
+        except (KeyError, TypeError, ValueError):
+            result['invalid'] += 1
+            continue
+
+        if os.path.exists(filepath) and not overwrite:
+            result['skipped'] += 1
+            continue
+
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        result['imported'] += 1
+
+    return result
+
+
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='健康記録のエクスポート・インポート')
+    parser.add_argument('--data-dir', default=os.getenv('DATA_DIR', 'data'), help='記録のディレクトリ')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help='記録をエクスポートする')
+    export_parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='ndjson')
+    export_parser.add_argument('--start', type=_parse_date, help='開始日 (YYYY-MM-DD)')
+    export_parser.add_argument('--end', type=_parse_date, help='終了日 (YYYY-MM-DD)')
+    export_parser.add_argument('--keywords', help='キーワード（スペースまたはコンマ区切り、OR条件）')
+    export_parser.add_argument('-o', '--output', help='出力ファイル（省略時は標準出力）')
+
+    import_parser = subparsers.add_parser('import', help='エクスポートデータを取り込む')
+    import_parser.add_argument('input', help="入力ファイル（'-' で標準入力）")
+    import_parser.add_argument('--overwrite', action='store_true', help='既存の記録を上書きする')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'export':
+        chunks = export_records(args.data_dir, args.format, args.start, args.end, args.keywords)
+        if args.output:
+            with open(args.output, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+        else:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+        return 0
+
+    if args.input == '-':
+        result = import_records(args.data_dir, sys.stdin.buffer, overwrite=args.overwrite)
+    else:
+        with open(args.input, 'rb') as f:
+            result = import_records(args.data_dir, f, overwrite=args.overwrite)
+    print(f"取り込み: {result['imported']}件, スキップ: {result['skipped']}件, 不正: {result['invalid']}件",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,190 @@
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+from collections import deque
+
+
+class TaskExecutor:
+    """保存後の重い処理をバックグラウンドで実行するタスク実行器
+
+    ジョブはキューディレクトリに1件1ファイルで永続化され、完了すると削除される。
+    再起動時は recover() で未完了のジョブを再投入する。
+    """
+
+    def __init__(self, queue_dir, max_workers=2, max_retries=3, retry_delay=1.0):
+        self.queue_dir = queue_dir
+        self.failed_dir = os.path.join(queue_dir, 'failed')
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        os.makedirs(self.queue_dir, exist_ok=True)
+
+        self._handlers = {}
+        # 未着手のジョブ（重複排除キー -> ジョブID）と実行待ちの列
+        self._queued = {}
+        self._pending = deque()
+        self._active = 0
+        self._accepting = True
+        self._stopped = False
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._work = threading.Condition(self._lock)
+        self._stopping = threading.Event()
+
+        # ワーカーはデーモンスレッドにして、終了時の待ち時間を shutdown() の timeout だけで決める
+        # （ThreadPoolExecutor は atexit より前に残りのジョブをすべて実行してしまう）
+        self._workers = [
+            threading.Thread(target=self._worker, name=f'task-{i}', daemon=True)
+            for i in range(max(int(max_workers), 1))
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def register(self, name, handler, max_retries=None):
+        """タスク名とハンドラを登録する"""
+        self._handlers[name] = (handler, self.max_retries if max_retries is None else max_retries)
+
+    def submit(self, name, **kwargs):
+        """ジョブを投入してジョブIDを返す
+
+        同じタスク名・引数のジョブが未着手で残っている場合は投入せず、そのジョブIDを返す。
+        """
+        if name not in self._handlers:
+            raise ValueError(f'未登録のタスクです: {name}')
+
+        key = _job_key(name, kwargs)
+        with self._lock:
+            if not self._accepting:
+                raise RuntimeError('タスク実行器は停止処理中です')
+            if key in self._queued:
+                return self._queued[key]
+
+            job = {
+                'id': f'{time.time_ns()}_{uuid.uuid4().hex[:8]}',
+                'name': name,
+                'kwargs': kwargs,
+                'attempts': 0,
+            }
+            self._write_job(job)
+            self._enqueue(job, key)
+        return job['id']
+
+    def recover(self):
+        """前回の実行で完了しなかったジョブを再投入する"""
+        recovered = 0
+        for filename in sorted(os.listdir(self.queue_dir)):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.queue_dir, filename), 'r', encoding='utf-8') as f:
+                    job = json.load(f)
+            except (json.JSONDecodeError, OSError):
+                continue
+            if job.get('name') not in self._handlers:
+                continue
+
+            key = _job_key(job['name'], job['kwargs'])
+            with self._lock:
+                if key in self._queued:
+                    # 重複したジョブはファイルごと取り除く
+                    self._remove_job(job)
+                    continue
+                self._enqueue(job, key)
+            recovered += 1
+        return recovered
+
+    def wait(self, timeout=None):
+        """投入済みのジョブがすべて終わるまで待つ"""
+        with self._lock:
+            return self._idle.wait_for(lambda: not self._queued and self._active == 0, timeout)
+
+    def shutdown(self, timeout=None):
+        """新規投入を止め、実行中のジョブを待ってから停止する
+
+        時間内に終わらなかったジョブはファイルに残り、次回起動時に再実行される。
+        """
+        with self._lock:
+            self._accepting = False
+        self._stopping.set()
+        drained = self.wait(timeout)
+        with self._lock:
+            # 未着手のジョブは実行せずに終える（ファイルは残す）
+            self._stopped = True
+            self._pending.clear()
+            self._queued.clear()
+            self._work.notify_all()
+            self._idle.notify_all()
+        return drained
+
+    def _enqueue(self, job, key):
+        """ロックを保持した状態で呼び出す"""
+        self._queued[key] = job['id']
+        self._pending.append((job, key))
+        self._work.notify()
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                self._work.wait_for(lambda: self._pending or self._stopped)
+                if self._stopped:
+                    return
+                job, key = self._pending.popleft()
+                # 着手した時点で重複排除の対象から外す（以降の投入は新しいジョブになる）
+                self._queued.pop(key, None)
+                self._active += 1
+            self._run(job)
+
+    def _run(self, job):
+        try:
+            handler, max_retries = self._handlers[job['name']]
+            while True:
+                try:
+                    handler(**job['kwargs'])
+                    self._remove_job(job)
+                    return
+                except Exception as e:
+                    job['attempts'] += 1
+                    job['last_error'] = repr(e)
+                    print(f"タスク {job['name']} が失敗しました（{job['attempts']}回目）: {e!r}", file=sys.stderr)
+                    if job['attempts'] > max_retries:
+                        self._move_to_failed(job)
+                        return
+                    self._write_job(job)
+                    # 停止処理中は再試行せず、次回起動時に任せる
+                    if self._stopping.wait(self.retry_delay * job['attempts']):
+                        return
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._idle.notify_all()
+
+    def _job_path(self, job):
+        return os.path.join(self.queue_dir, f"{job['id']}.json")
+
+    def _write_job(self, job):
+        # 書き込み途中のファイルを読まないよう、一時ファイル経由で置き換える
+        path = self._job_path(job)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _remove_job(self, job):
+        try:
+            os.remove(self._job_path(job))
+        except FileNotFoundError:
+            pass
+
+    def _move_to_failed(self, job):
+        try:
+            os.makedirs(self.failed_dir, exist_ok=True)
+            os.replace(self._job_path(job), os.path.join(self.failed_dir, f"{job['id']}.json"))
+        except OSError:
+            pass
+
+
+def _job_key(name, kwargs):
+    """重複排除に使うキー（タスク名と引数の組）"""
+    return name + ':' + json.dumps(kwargs, sort_keys=True, ensure_ascii=False)
@@ -74,7 +74,7 @@ class Test健康記録保存機能:
         
         client.post('/', data={'health_record': health_record})
         
-        files = os.listdir(temp_data_dir)
+        files = [f for f in os.listdir(temp_data_dir) if f.startswith('health_record_')]
         assert len(files) == 1
     
     def test_作成されるファイル名の形式が正しい(self, client, temp_data_dir):
@@ -83,7 +83,7 @@ class Test健康記録保存機能:
         
         client.post('/', data={'health_record': health_record})
         
-        files = os.listdir(temp_data_dir)
+        files = [f for f in os.listdir(temp_data_dir) if f.startswith('health_record_')]
         filename = files[0]
         
         # ファイル名の形式をテスト: health_record_YYYYMMDD_HHMMSS.json
@@ -96,7 +96,7 @@ class Test健康記録保存機能:
         
         client.post('/', data={'health_record': health_record})
         
-        files = os.listdir(temp_data_dir)
+        files = [f for f in os.listdir(temp_data_dir) if f.startswith('health_record_')]
         filename = files[0]
         
         with open(os.path.join(temp_data_dir, filename), 'r', encoding='utf-8') as f:
@@ -257,6 +257,16 @@ class TestOllamaペイロード機能:
         assert payload['stream'] is False
         assert message in payload['prompt']
     
+    def test_ペイロードにプロンプトに合わせたオプションが含まれる(self):
+        """num_ctx と質問の種類に応じた num_predict がペイロードに含まれることをテスト"""
+        from app import create_ollama_payload
+        from ollama_options import NUM_PREDICT_BY_TYPE
+        
+        payload = create_ollama_payload("最近の体重の傾向を教えて")
+        
+        assert payload['options']['num_ctx'] in (2048, 4096, 8192, 16384, 32768)
+        assert payload['options']['num_predict'] == NUM_PREDICT_BY_TYPE['analysis']
+    
     def test_システムプロンプト付きペイロード生成(self):
         """システムプロンプトが含まれたペイロードが生成されることをテスト"""
         from app import create_ollama_payload
@@ -401,3 +411,330 @@ class Testデータフィルタリング機能:
         expected_contents = {"体重: 70kg 血圧: 120/80", "頭痛がひどい 薬を飲んだ"}
         assert matched_contents == expected_contents
     
+
+class Test数値統計API:
+    """数値統計API機能のテストクラス"""
+    
+    def test_統計APIが集計値を返す(self, client, temp_data_dir):
+        """/api/stats が記録から抽出した数値の集計値を返すことをテスト"""
+        create_test_record(temp_data_dir, "体重: 70kg 血圧: 120/80", 3)
+        create_test_record(temp_data_dir, "体重: 72kg 血圧: 130/90", 2)
+        create_test_record(temp_data_dir, "体重: 80kg", 45)
+        
+        response = client.get('/api/stats?days=30&fields=weight,systolic')
+        
+        assert response.status_code == 200
+        stats = response.get_json()['stats']
+        assert stats['weight']['count'] == 2
+        assert stats['weight']['mean'] == 71.0
+        assert stats['systolic']['max'] == 130.0
+        assert 'pulse' not in stats
+    
+    def test_保存した記録が統計に反映される(self, client, temp_data_dir):
+        """記録の保存後に統計APIの結果へ反映されることをテスト"""
+        from app import get_task_executor
+        
+        create_test_record(temp_data_dir, "体重: 70kg", 3)
+        client.get('/api/stats')
+        
+        client.post('/', data={'health_record': '体重: 74kg'})
+        # 反映はバックグラウンドタスクで行われる
+        get_task_executor(temp_data_dir).wait(timeout=5)
+        response = client.get('/api/stats?fields=weight')
+        
+        assert response.get_json()['stats']['weight']['count'] == 2
+    
+    def test_移動平均は指定した点数だけ返す(self, client, temp_data_dir):
+        """limit を指定すると移動平均が新しい方からその点数だけ返ることをテスト"""
+        for days_ago in range(1, 11):
+            create_test_record(temp_data_dir, f"体重: {60 + days_ago}kg", days_ago)
+        
+        response = client.get('/api/stats?fields=weight&window=1&limit=3')
+        
+        moving_average = response.get_json()['stats']['weight']['moving_average']
+        assert [point['value'] for point in moving_average] == [63.0, 62.0, 61.0]
+    
+    def test_構築中に保存された記録も反映される(self, temp_data_dir, monkeypatch):
+        """ストアの構築中に保存された記録の反映タスクが、構築の完了を待って反映することをテスト"""
+        import threading
+        import time
+        import app as app_module
+        
+        create_test_record(temp_data_dir, "体重: 70kg", 3)
+        listed = threading.Event()
+        release = threading.Event()
+        original_load = app_module.load_health_records
+        
+        def slow_load(data_dir, *args, **kwargs):
+            records = original_load(data_dir, *args, **kwargs)
+            listed.set()
+            release.wait(5)
+            return records
+        
+        monkeypatch.setattr(app_module, 'load_health_records', slow_load)
+        builder = threading.Thread(target=app_module.get_vitals_store, args=(temp_data_dir,))
+        builder.start()
+        assert listed.wait(5)
+        
+        # ファイル一覧を取った後に保存された記録
+        create_test_record(temp_data_dir, "体重: 74kg", 1)
+        filename = sorted(name for name in os.listdir(temp_data_dir) if name.startswith('health_record_'))[-1]
+        updater = threading.Thread(target=app_module.update_vitals_store, args=(temp_data_dir, filename))
+        updater.start()
+        time.sleep(0.1)
+        release.set()
+        builder.join(5)
+        updater.join(5)
+        
+        assert len(app_module.get_vitals_store(temp_data_dir)) == 2
+    
+    def test_不明な項目はエラーになる(self, client, temp_data_dir):
+        """存在しない項目を指定すると400エラーになることをテスト"""
+        response = client.get('/api/stats?fields=height')
+        
+        assert response.status_code == 400
+    
+    def test_ペイロードに数値サマリーが含まれる(self, temp_data_dir):
+        """ペイロードのプロンプトに数値サマリーが含まれることをテスト"""
+        from app import create_ollama_payload
+        
+        create_test_record(temp_data_dir, "体重: 70kg 血圧: 120/80", 3)
+        create_test_record(temp_data_dir, "体重: 72kg", 2)
+        
+        payload = create_ollama_payload("体重について教えて", data_dir=temp_data_dir)
+        
+        assert '数値サマリー' in payload['prompt']
+        assert '体重: 平均71kg' in payload['prompt']
+
+
+class Testバックグラウンドタスク:
+    """保存後のバックグラウンドタスク機能のテストクラス"""
+    
+    def test_保存時にタスクが投入されすぐにリダイレクトする(self, client, temp_data_dir):
+        """保存後の処理を待たずにリダイレクトし、タスクが完了するとキューが空になることをテスト"""
+        from app import get_task_executor
+        
+        response = client.post('/', data={'health_record': '体重: 70kg'})
+        
+        assert response.status_code == 302
+        executor = get_task_executor(temp_data_dir)
+        assert executor.wait(timeout=5)
+        queued = [f for f in os.listdir(executor.queue_dir) if f.endswith('.json')]
+        assert queued == []
+
+    
+    def test_起動時に残っていたジョブを再実行する(self, temp_data_dir):
+        """前回の未完了ジョブが記録の保存を待たずに再実行されることをテスト"""
+        import app as app_module
+        
+        create_test_record(temp_data_dir, "体重: 70kg", 3)
+        store = app_module.get_vitals_store(temp_data_dir)
+        create_test_record(temp_data_dir, "体重: 74kg", 1)
+        filename = sorted(name for name in os.listdir(temp_data_dir) if name.startswith('health_record_'))[-1]
+        queue_dir = os.path.join(temp_data_dir, app_module.TASK_QUEUE_DIRNAME)
+        os.makedirs(queue_dir)
+        with open(os.path.join(queue_dir, '1_pending.json'), 'w', encoding='utf-8') as f:
+            json.dump({'id': '1_pending', 'name': 'update_vitals', 'attempts': 0,
+                       'kwargs': {'data_dir': temp_data_dir, 'filename': filename}}, f)
+        
+        executor = app_module.recover_task_executor(temp_data_dir)
+        
+        assert executor.wait(timeout=5)
+        assert len(store) == 2
+        assert os.listdir(queue_dir) == []
+    
+    def test_キューがなければ起動時に実行器を作らない(self, temp_data_dir):
+        """前回のジョブが残っていないときは実行器もキューディレクトリも作られないことをテスト"""
+        import app as app_module
+        
+        assert app_module.recover_task_executor(temp_data_dir) is None
+        assert temp_data_dir not in app_module._task_executors
+        assert os.listdir(temp_data_dir) == []
+
+
+class Testエクスポート_インポートAPI:
+    """エクスポート・インポートAPI機能のテストクラス"""
+    
+    def test_NDJSONでエクスポートできる(self, client, temp_data_dir):
+        """/api/export がNDJSONをストリーミングで返すことをテスト"""
+        create_test_record(temp_data_dir, "体重: 70kg", 3)
+        create_test_record(temp_data_dir, "頭痛がひどい", 2)
+        
+        response = client.get('/api/export?format=ndjson&keywords=体重')
+        
+        assert response.status_code == 200
+        assert response.is_streamed
+        assert 'attachment' in response.headers['Content-Disposition']
+        lines = response.get_data(as_text=True).splitlines()
+        assert [json.loads(line)['health_record'] for line in lines] == ["体重: 70kg"]
+    
+    def test_不正なパラメータはエラーになる(self, client, temp_data_dir):
+        """不明な形式や不正な日付を指定すると400エラーになることをテスト"""
+        assert client.get('/api/export?format=csv').status_code == 400
+        assert client.get('/api/export?start=2025/08/01').status_code == 400
+    
+    def test_エクスポートしたgzipをインポートできる(self, client, temp_data_dir):
+        """gzipでエクスポートしたデータをファイルアップロードで復元できることをテスト"""
+        import io
+        
+        create_test_record(temp_data_dir, "体重: 70kg", 3)
+        create_test_record(temp_data_dir, "頭痛がひどい", 2)
+        exported = client.get('/api/export?format=gzip').get_data()
+        for filename in os.listdir(temp_data_dir):
+            if filename.startswith('health_record_'):
+                os.remove(os.path.join(temp_data_dir, filename))
+        
+        response = client.post('/api/import', data={'file': (io.BytesIO(exported), 'backup.ndjson.gz')})
+        
+        assert response.status_code == 200
+        assert response.get_json()['imported'] == 2
+        assert len([f for f in os.listdir(temp_data_dir) if f.startswith('health_record_')]) == 2
+
+
+class Test記録一覧機能:
+    """記録一覧（カーソルによるページ送り）機能のテストクラス"""
+    
+    def test_記録一覧ページが表示される(self, client, temp_data_dir):
+        """/records に最新の記録が表示されることをテスト"""
+        create_test_record(temp_data_dir, "体重: 70kg", 3)
+        create_test_record(temp_data_dir, "頭痛がひどい", 2)
+        
+        response = client.get('/records')
+        
+        assert response.status_code == 200
+        assert '記録一覧'.encode('utf-8') in response.data
+        assert '体重: 70kg'.encode('utf-8') in response.data
+        assert '頭痛がひどい'.encode('utf-8') in response.data
+    
+    def test_記録APIがカーソルでページ送りできる(self, client, temp_data_dir):
+        """/api/records の next_cursor で次のページを取得できることをテスト"""
+        for days_ago in range(5, 0, -1):
+            create_test_record(temp_data_dir, f"{days_ago}日前の記録", days_ago)
+        
+        first = client.get('/api/records?limit=2').get_json()
+        second = client.get(f"/api/records?limit=2&before={first['next_cursor']}").get_json()
+        
+        assert [record['health_record'] for record in first['records']] == ["1日前の記録", "2日前の記録"]
+        assert [record['health_record'] for record in second['records']] == ["3日前の記録", "4日前の記録"]
+    
+    def test_保存した記録が一覧に反映される(self, client, temp_data_dir):
+        """保存した記録が一覧APIの先頭に現れることをテスト"""
+        create_test_record(temp_data_dir, "古い記録", 3)
+        client.get('/api/records')
+        
+        client.post('/', data={'health_record': '新しい記録'})
+        page = client.get('/api/records').get_json()
+        
+        assert page['records'][0]['health_record'] == '新しい記録'
+    
+    def test_不正なカーソルはエラーになる(self, client, temp_data_dir):
+        """形式が正しくないカーソルを指定すると400エラーになることをテスト"""
+        response = client.get('/api/records?before=../../etc')
+        
+        assert response.status_code == 400
+
+
+class Test長期間モード:
+    """長期間モード（分割・並列問い合わせ）機能のテストクラス"""
+    
+    def test_文脈が大きいとジョブで処理され進捗が取得できる(self, client, temp_data_dir, monkeypatch):
+        """記録が1回の呼び出しに収まらないときジョブが開始され、完了後に回答が取得できることをテスト"""
+        import time
+        import app as app_module
+        
+        for days_ago in range(1, 31):
+            create_test_record(temp_data_dir, f"体重: 70kg 血圧: 120/80 {days_ago}日前", days_ago)
+        monkeypatch.setattr(app_module, 'CONTEXT_TOKEN_BUDGET', 100)
+        monkeypatch.setattr(app_module, 'generate_with_ollama',
+                            lambda prompt, question_type: "# まとめ\n体重は安定しています")
+        
+        response = client.post('/chat', data={'message': '体重の傾向は？', 'days': '90'})
+        
+        assert response.status_code == 200
+        match = re.search(r'data-job-id="([0-9a-f]+)"', response.get_data(as_text=True))
+        assert match
+        
+        for _ in range(50):
+            job = client.get(f'/api/chat/jobs/{match.group(1)}').get_json()
+            if job['status'] != 'running':
+                break
+            time.sleep(0.1)
+        assert job['status'] == 'done'
+        assert job['completed'] == job['total']
+        assert '<h1>まとめ</h1>' in job['answer']
+    
+    def test_予期しない例外でもジョブはエラーで終わる(self, client, temp_data_dir, monkeypatch):
+        """統合の呼び出しが想定外の例外を出してもジョブが running のまま残らないことをテスト"""
+        import time
+        import app as app_module
+        
+        for days_ago in range(1, 31):
+            create_test_record(temp_data_dir, f"体重: 70kg 血圧: 120/80 {days_ago}日前", days_ago)
+        monkeypatch.setattr(app_module, 'CONTEXT_TOKEN_BUDGET', 100)
+        
+        def generate_with_ollama(prompt, question_type):
+            if question_type == 'partial':
+                return "安定しています"
+            raise ValueError('不正な応答')
+        
+        monkeypatch.setattr(app_module, 'generate_with_ollama', generate_with_ollama)
+        
+        response = client.post('/chat', data={'message': '体重の傾向は？', 'days': '90'})
+        match = re.search(r'data-job-id="([0-9a-f]+)"', response.get_data(as_text=True))
+        assert match
+        
+        for _ in range(50):
+            job = client.get(f'/api/chat/jobs/{match.group(1)}').get_json()
+            if job['status'] != 'running':
+                break
+            time.sleep(0.1)
+        assert job['status'] == 'error'
+    
+    def test_同時に走るジョブ全体で呼び出し数が制限される(self, temp_data_dir, monkeypatch):
+        """2つのジョブが同時に走ってもOllamaへの同時呼び出しが LONG_QUERY_PARALLELISM 件以内であることをテスト"""
+        import threading
+        import time
+        import app as app_module
+        
+        records = [
+            {"health_record": f"体重: 70kg 血圧: 120/80 {day}日目", "timestamp": f"2025-08-{day:02d}T08:30:00"}
+            for day in range(1, 31)
+        ]
+        monkeypatch.setattr(app_module, 'CONTEXT_TOKEN_BUDGET', 100)
+        monkeypatch.setattr(app_module, 'LONG_QUERY_PARALLELISM', 2)
+        monkeypatch.setattr(app_module, '_long_query_slots', threading.BoundedSemaphore(2))
+        
+        lock = threading.Lock()
+        running = [0]
+        peak = [0]
+        
+        def generate_with_ollama(prompt, question_type):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+            return "安定しています"
+        
+        monkeypatch.setattr(app_module, 'generate_with_ollama', generate_with_ollama)
+        
+        job_ids = [app_module.start_long_query_job('体重の傾向は？', records) for _ in range(2)]
+        for _ in range(100):
+            if all(app_module._chat_jobs[job_id]['status'] != 'running' for job_id in job_ids):
+                break
+            time.sleep(0.05)
+        
+        assert [app_module._chat_jobs[job_id]['status'] for job_id in job_ids] == ['done', 'done']
+        assert peak[0] <= 2
+    
+    def test_存在しないジョブは404になる(self, client):
+        """不明なジョブIDを指定すると404になることをテスト"""
+        assert client.get('/api/chat/jobs/unknown').status_code == 404
+    
+    def test_チャットページに長期間の選択肢がある(self, client):
+        """期間指定に3ヶ月と1年の選択肢があることをテスト"""
+        response = client.get('/chat')
+        
+        assert '3ヶ月'.encode('utf-8') in response.data
+        assert '1年'.encode('utf-8') in response.data
@@ -0,0 +1,105 @@
+import pytest
+from context_encoder import encode_context, normalize_text, estimate_tokens
+
+
+def make_record(content, timestamp):
+    return {"health_record": content, "timestamp": timestamp}
+
+
+class Test文脈エンコード:
+    """プロンプト用の文脈エンコードのテストクラス"""
+    
+    def test_日付ごとにまとめて時刻だけを表示する(self):
+        """同じ日の記録が日付見出しの下に時刻付きでまとめられることをテスト"""
+        records = [
+            make_record("夕方の記録", "2025-08-16T17:30:00.123456"),
+            make_record("朝の記録", "2025-08-16T08:30:00.654321"),
+        ]
+        
+        encoded, _ = encode_context(records)
+        
+        assert encoded == "[2025-08-16]\n08:30 朝の記録\n17:30 夕方の記録\n"
+    
+    def test_同じ内容の連続を省略して注記する(self):
+        """前日の同じ時間帯と同じ内容が続く記録は省略され、日数が注記されることをテスト"""
+        records = [make_record("薬を飲んだ。", f"2025-08-{day:02d}T08:30:00") for day in range(10, 16)]
+        records.append(make_record("薬を飲んだ 。", "2025-08-16T08:30:00"))  # 空白・句読点の違いは同じとみなす
+        records.append(make_record("体重: 70kg", "2025-08-16T17:30:00"))
+        
+        encoded, stats = encode_context(records)
+        
+        assert encoded == (
+            "[2025-08-10]\n08:30 薬を飲んだ。 (同じ内容が8/16まで7日間続く)\n"
+            "[2025-08-16]\n17:30 体重: 70kg\n"
+        )
+        assert stats['records'] == 8
+    
+    def test_時刻が数分ずれても連続とみなす(self):
+        """毎日の記録時刻が数分ずれていても同じ時間帯なら省略されることをテスト"""
+        records = [
+            make_record("朝: 薬を飲んだ", "2025-08-10T08:30:00"),
+            make_record("朝: 薬を飲んだ", "2025-08-11T08:32:00"),
+            make_record("朝: 薬を飲んだ", "2025-08-12T08:31:00"),
+            make_record("朝: 薬を飲んだ", "2025-08-12T20:05:00"),
+        ]
+        
+        encoded, _ = encode_context(records)
+        
+        assert encoded == (
+            "[2025-08-10]\n08:30 朝: 薬を飲んだ (同じ内容が8/12まで3日間続く)\n"
+            "[2025-08-12]\n20:05 朝: 薬を飲んだ\n"
+        )
+    
+    def test_日付が空いたら連続とみなさない(self):
+        """1日以上間が空いた同じ内容の記録は省略されないことをテスト"""
+        records = [
+            make_record("薬を飲んだ", "2025-08-10T08:30:00"),
+            make_record("薬を飲んだ", "2025-08-12T08:30:00"),
+        ]
+        
+        encoded, _ = encode_context(records)
+        
+        assert encoded.count("薬を飲んだ") == 2
+    
+    def test_日時が読めない記録も残す(self):
+        """タイムスタンプがない・読めない記録が日時不明の欄に出力され、件数に含まれることをテスト"""
+        records = [
+            make_record("朝の記録", "2025-08-16T08:30:00"),
+            make_record("日付の壊れた記録", "8月16日の朝"),
+            {"health_record": "日付のない記録"},
+        ]
+        
+        encoded, stats = encode_context(records)
+        
+        assert encoded == (
+            "[2025-08-16]\n08:30 朝の記録\n"
+            "[日時不明]\n8月16日の朝 日付の壊れた記録\n日付のない記録\n"
+        )
+        assert stats['records'] == 3
+    
+    def test_トークン削減量を報告する(self):
+        """従来形式と比べたトークン数と削減量が返ることをテスト"""
+        records = [make_record("朝: 血圧 120/80\n\n  体重 70kg", f"2025-08-{day:02d}T08:30:00.123456") for day in range(1, 11)]
+        
+        _, stats = encode_context(records)
+        
+        assert stats['encoded_tokens'] < stats['raw_tokens']
+        assert stats['saved_tokens'] == stats['raw_tokens'] - stats['encoded_tokens']
+    
+    def test_記録がなければ空になる(self):
+        """記録が空のとき空文字列が返ることをテスト"""
+        encoded, stats = encode_context([])
+        
+        assert encoded == ''
+        assert stats['raw_tokens'] == 0
+
+
+def test_本文の正規化():
+    """全角英数字の半角化、空白の圧縮、改行の連結が行われることをテスト"""
+    assert normalize_text("体重：７０ｋｇ\r\n\n  血圧   120/80  ") == "体重:70kg / 血圧 120/80"
+
+
+def test_トークン数の見積もり():
+    """英数字は単語単位、日本語は1文字単位で数えることをテスト"""
+    assert estimate_tokens("hello world") == 2
+    assert estimate_tokens("体重 70kg") == 3
@@ -0,0 +1,133 @@
+import pytest
+import json
+import time
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from loadtest import FakeOllamaServer, LoadDriver, start_in_thread, percentile
+from context_encoder import estimate_tokens
+
+
+@pytest.fixture
+def fake_ollama():
+    servers = []
+    
+    def start(**kwargs):
+        server = FakeOllamaServer(('127.0.0.1', 0), **kwargs)
+        start_in_thread(server)
+        servers.append(server)
+        return server
+    
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+class TestフェイクOllama:
+    """フェイクOllamaサーバーのテストクラス"""
+    
+    def test_非ストリーミングで応答する(self, fake_ollama):
+        """stream=False のとき1つのJSONで応答し、トークン数が返ることをテスト"""
+        server = fake_ollama(prefill_ms=0, decode_ms=0, response_tokens=12)
+        
+        response = requests.post(server.url, json={'model': 'llama3', 'prompt': '体重 is 70kg', 'stream': False})
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data['done'] is True
+        assert data['eval_count'] == 12
+        assert data['prompt_eval_count'] == estimate_tokens('体重 is 70kg')
+        assert data['response']
+    
+    def test_ストリーミングで1トークンずつ応答する(self, fake_ollama):
+        """stream=True のときNDJSONで1トークンずつ返り、最後に done が来ることをテスト"""
+        server = fake_ollama(prefill_ms=0, decode_ms=0, response_tokens=5)
+        
+        response = requests.post(server.url, json={'model': 'llama3', 'prompt': 'hi', 'stream': True}, stream=True)
+        
+        chunks = [json.loads(line) for line in response.iter_lines() if line]
+        assert len(chunks) == 6
+        assert all(not chunk['done'] for chunk in chunks[:-1])
+        assert chunks[-1]['done'] is True
+    
+    def test_num_predictで出力トークン数が制限される(self, fake_ollama):
+        """options.num_predict が応答のトークン数の上限になることをテスト"""
+        server = fake_ollama(prefill_ms=0, decode_ms=0, response_tokens=50)
+        
+        response = requests.post(server.url, json={'prompt': 'hi', 'stream': False, 'options': {'num_predict': 8}})
+        
+        assert response.json()['eval_count'] == 8
+    
+    def test_障害を注入できる(self, fake_ollama):
+        """failure_rate=1 のとき常に500エラーを返すことをテスト"""
+        server = fake_ollama(failure_rate=1.0)
+        
+        response = requests.post(server.url, json={'prompt': 'hi', 'stream': False})
+        
+        assert response.status_code == 500
+
+
+class StubJobAppHandler(BaseHTTPRequestHandler):
+    """長期間モードのチャット（ジョブIDを返し、一定時間後に完了する）を模したハンドラ"""
+    
+    def do_POST(self):
+        self.server.started = time.perf_counter()
+        self._send('text/html', '<div id="long-query" data-job-id="job1"></div>')
+    
+    def do_GET(self):
+        running = time.perf_counter() - self.server.started < self.server.job_seconds
+        status = 'running' if running else self.server.final_status
+        self._send('application/json', json.dumps({'status': status}))
+    
+    def _send(self, content_type, body):
+        data = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+class Test負荷ドライバ:
+    """負荷ドライバのテストクラス"""
+    
+    @pytest.fixture
+    def stub_app(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StubJobAppHandler)
+        server.job_seconds = 0.3
+        server.final_status = 'done'
+        start_in_thread(server)
+        yield server
+        server.shutdown()
+        server.server_close()
+    
+    def test_ジョブの完了までを応答時間として計測する(self, stub_app):
+        """data-job-id を含む応答ではジョブの完了まで待って計測されることをテスト"""
+        driver = LoadDriver(f'http://127.0.0.1:{stub_app.server_address[1]}')
+        
+        driver._request(requests.Session(), 'POST /chat', 'post', '/chat')
+        
+        assert driver.samples['POST /chat'][0] >= 0.3
+        assert driver.errors == {}
+    
+    def test_ジョブが失敗したらエラーとして数える(self, stub_app):
+        """ジョブが error で終わった場合にエラーとして数えられることをテスト"""
+        stub_app.final_status = 'error'
+        driver = LoadDriver(f'http://127.0.0.1:{stub_app.server_address[1]}')
+        
+        driver._request(requests.Session(), 'POST /chat', 'post', '/chat')
+        
+        assert driver.errors == {'POST /chat': 1}
+
+
+def test_パーセンタイル():
+    """線形補間でパーセンタイルが計算されることをテスト"""
+    values = [1.0, 2.0, 3.0, 4.0, 5.0]
+    
+    assert percentile(values, 50) == 3.0
+    assert percentile(values, 95) == pytest.approx(4.8)
+    assert percentile([], 50) is None
+
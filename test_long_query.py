@@ -0,0 +1,83 @@
+import pytest
+import threading
+from long_query import chunk_records, map_reduce_answer, MISSING_PARTIAL
+
+
+def make_records(days, content="体重: 70kg 血圧: 120/80 よく眠れた"):
+    return [{"health_record": f"{content} {day}日目", "timestamp": f"2025-01-{day:02d}T08:30:00"}
+            for day in range(1, days + 1)]
+
+
+class Test記録の分割:
+    """記録の分割機能のテストクラス"""
+    
+    def test_トークン数の上限で分割される(self):
+        """各チャンクが上限内に収まり、全記録が時刻順に含まれることをテスト"""
+        records = make_records(20)
+        
+        chunks = chunk_records(list(reversed(records)), max_tokens=60)
+        
+        assert len(chunks) > 1
+        flattened = [record for chunk in chunks for record in chunk]
+        assert flattened == records
+    
+    def test_上限に収まれば1つになる(self):
+        """記録が少なければ分割されないことをテスト"""
+        assert len(chunk_records(make_records(3), max_tokens=10000)) == 1
+
+
+class Test分割統合回答:
+    """分割した記録ごとの問い合わせと統合のテストクラス"""
+    
+    def test_分割ごとに問い合わせて最後に統合する(self):
+        """チャンク数分の並列呼び出しの後に統合の呼び出しが1回行われることをテスト"""
+        prompts = []
+        lock = threading.Lock()
+        
+        def generate(prompt, stage):
+            with lock:
+                prompts.append((prompt, stage))
+            return "統合した回答" if stage == 'reduce' else "部分的な分析"
+        
+        progress = []
+        records = make_records(20)
+        chunks = chunk_records(records, max_tokens=60)
+        
+        answer = map_reduce_answer("体重の傾向は？", records, generate, "システム", max_tokens=60,
+                                   parallelism=3, summary="- 体重: 平均70kg",
+                                   on_progress=lambda *args: progress.append(args))
+        
+        assert answer == "統合した回答"
+        assert len(prompts) == len(chunks) + 1
+        reduce_prompt, stage = prompts[-1]
+        assert stage == 'reduce'
+        assert all(stage == 'map' for _, stage in prompts[:-1])
+        assert reduce_prompt.count("部分的な分析") == len(chunks)
+        assert "平均70kg" in reduce_prompt
+        assert progress[-1] == (len(chunks) + 1, len(chunks) + 1, 'reduce')
+    
+    def test_一部の失敗は注記して続行する(self):
+        """一部のチャンクが失敗しても統合に進み、失敗した期間が注記されることをテスト"""
+        prompts = []
+        
+        def generate(prompt, stage):
+            prompts.append(prompt)
+            # 最初の期間の問い合わせだけ失敗させる
+            if stage == 'map' and '2025-01-01〜' in prompt:
+                raise RuntimeError('接続エラー')
+            return "回答"
+        
+        records = make_records(20)
+        
+        answer = map_reduce_answer("質問", records, generate, "システム", max_tokens=60, parallelism=1)
+        
+        assert answer == "回答"
+        assert MISSING_PARTIAL in prompts[-1]
+    
+    def test_すべて失敗したらエラーになる(self):
+        """すべてのチャンクが失敗した場合は RuntimeError になることをテスト"""
+        def generate(prompt, stage):
+            raise ConnectionError('接続エラー')
+        
+        with pytest.raises(RuntimeError):
+            map_reduce_answer("質問", make_records(20), generate, "システム", max_tokens=60)
@@ -0,0 +1,54 @@
+import pytest
+from ollama_options import classify_question, choose_num_ctx, choose_options, NUM_CTX_BUCKETS, NUM_PREDICT_BY_TYPE
+
+
+class Test質問の種類判定:
+    """質問の種類判定のテストクラス"""
+    
+    @pytest.mark.parametrize("message,expected", [
+        ("最新の体重は何kg？", 'short'),
+        ("最近の体重の傾向を教えて", 'analysis'),
+        ("睡眠を改善するアドバイスは？", 'analysis'),
+        ("調子はどう？", 'default'),
+        ("いつも眠いのはどうして？", 'analysis'),
+        ("前回の通院から体調はどう？", 'default'),
+        ("いつも頭痛がする", 'default'),
+        ("最後に頭痛があったのはいつ？", 'short'),
+        ("前回の血圧は？", 'short'),
+    ])
+    def test_質問文から種類を判定する(self, message, expected):
+        """質問文のキーワードから回答の長さの種類が判定されることをテスト"""
+        assert classify_question(message) == expected
+
+
+class TestOllamaオプション:
+    """Ollamaオプションの選択のテストクラス"""
+    
+    def test_必要なトークン数が収まる最小の候補を選ぶ(self):
+        """num_ctx が候補の中から必要量以上の最小値で選ばれることをテスト"""
+        assert choose_num_ctx(100) == 2048
+        assert choose_num_ctx(2049) == 4096
+        assert choose_num_ctx(10 ** 6) == NUM_CTX_BUCKETS[-1]
+    
+    def test_プロンプトが長いとnum_ctxが大きくなる(self):
+        """プロンプトの長さに応じて num_ctx が大きくなり、num_predict 分の余裕があることをテスト"""
+        short_options, _ = choose_options("体重" * 10)
+        long_options, prompt_tokens = choose_options("体重" * 3000)
+        
+        assert short_options['num_ctx'] == 2048
+        assert long_options['num_ctx'] == 8192
+        assert long_options['num_ctx'] >= prompt_tokens + long_options['num_predict']
+    
+    def test_質問の種類でnum_predictが決まる(self):
+        """num_predict が質問の種類ごとの上限になることをテスト"""
+        options, _ = choose_options("質問", 'short')
+        
+        assert options['num_predict'] == NUM_PREDICT_BY_TYPE['short']
+    
+    def test_モデルごとのオプションが加わる(self):
+        """モデルごとの設定（num_thread など）が options に含まれることをテスト"""
+        options, _ = choose_options("質問", model_options={'num_thread': 8, 'num_batch': 256})
+        
+        assert options['num_thread'] == 8
+        assert options['num_batch'] == 256
+        assert 'num_ctx' in options
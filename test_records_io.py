@@ -0,0 +1,211 @@
+import pytest
+import io
+import os
+import json
+import gzip
+import shutil
+import zipfile
+import tempfile
+from datetime import datetime
+from records_io import RecordIndex, export_records, import_records, parse_keywords
+
+
+def write_record(data_dir, content, timestamp):
+    """テスト用の記録ファイルを作成する"""
+    record = {"health_record": content, "timestamp": timestamp}
+    filename = f"health_record_{datetime.fromisoformat(timestamp).strftime('%Y%m%d_%H%M%S')}.json"
+    with open(os.path.join(data_dir, filename), 'w', encoding='utf-8') as f:
+        json.dump(record, f, ensure_ascii=False)
+    return record
+
+
+@pytest.fixture
+def data_dir():
+    temp_dir = tempfile.mkdtemp()
+    write_record(temp_dir, "体重: 70kg", "2025-08-01T08:30:00")
+    write_record(temp_dir, "頭痛がひどい", "2025-08-02T08:30:00")
+    write_record(temp_dir, "体重: 71kg 血圧: 120/80", "2025-08-03T17:30:00")
+    yield temp_dir
+    shutil.rmtree(temp_dir)
+
+
+@pytest.fixture
+def restore_dir():
+    temp_dir = tempfile.mkdtemp()
+    yield temp_dir
+    shutil.rmtree(temp_dir)
+
+
+class Testエクスポート:
+    """記録のエクスポート機能のテストクラス"""
+    
+    def test_NDJSONで時刻順に出力される(self, data_dir):
+        """全記録が時刻順にNDJSONの1行1件で出力されることをテスト"""
+        data = b''.join(export_records(data_dir, 'ndjson'))
+        
+        lines = [json.loads(line) for line in data.decode('utf-8').splitlines()]
+        assert [record['health_record'] for record in lines] == ["体重: 70kg", "頭痛がひどい", "体重: 71kg 血圧: 120/80"]
+    
+    def test_期間とキーワードで絞り込まれる(self, data_dir):
+        """期間とキーワードの両方で絞り込まれることをテスト"""
+        data = b''.join(export_records(
+            data_dir, 'ndjson', start=datetime(2025, 8, 2), end=datetime(2025, 8, 3), keywords="体重"))
+        
+        lines = [json.loads(line) for line in data.decode('utf-8').splitlines()]
+        assert [record['health_record'] for record in lines] == ["体重: 71kg 血圧: 120/80"]
+    
+    def test_gzipで圧縮される(self, data_dir):
+        """gzip形式の出力が展開するとNDJSONになることをテスト"""
+        data = b''.join(export_records(data_dir, 'gzip'))
+        
+        lines = gzip.decompress(data).decode('utf-8').splitlines()
+        assert len(lines) == 3
+    
+    def test_zipは1件1ファイルになる(self, data_dir):
+        """zip形式の出力に記録ファイルと同じ名前のエントリが含まれることをテスト"""
+        data = b''.join(export_records(data_dir, 'zip'))
+        
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            assert archive.namelist() == sorted(os.listdir(data_dir))
+    
+    def test_不明な形式はエラーになる(self, data_dir):
+        """未対応の形式を指定すると ValueError になることをテスト"""
+        with pytest.raises(ValueError):
+            export_records(data_dir, 'csv')
+
+
+class Testインポート:
+    """記録のインポート機能のテストクラス"""
+    
+    @pytest.mark.parametrize("export_format", ['ndjson', 'gzip', 'zip'])
+    def test_エクスポートしたデータを復元できる(self, data_dir, restore_dir, export_format):
+        """エクスポートしたデータを取り込むと同じ記録ファイルが復元されることをテスト"""
+        data = b''.join(export_records(data_dir, export_format))
+        
+        result = import_records(restore_dir, io.BytesIO(data))
+        
+        assert result == {'imported': 3, 'skipped': 0, 'invalid': 0}
+        assert sorted(os.listdir(restore_dir)) == sorted(os.listdir(data_dir))
+    
+    def test_既存の記録はスキップされる(self, data_dir):
+        """同じファイル名の記録が既にある場合はスキップされることをテスト"""
+        data = b''.join(export_records(data_dir, 'ndjson'))
+        
+        result = import_records(data_dir, io.BytesIO(data))
+        
+        assert result['skipped'] == 3
+        assert result['imported'] == 0
+    
+    def test_不正な行は数えて読み飛ばす(self, restore_dir):
+        """JSONとして読めない行や項目が欠けた行が invalid として数えられることをテスト"""
+        data = '{"health_record": "体重: 70kg", "timestamp": "2025-08-01T08:30:00"}\nnot json\n{"health_record": "x"}\n'
+        
+        result = import_records(restore_dir, io.BytesIO(data.encode('utf-8')))
+        
+        assert result == {'imported': 1, 'skipped': 0, 'invalid': 2}
+    
+    def test_本文が文字列でない記録は取り込まない(self, restore_dir):
+        """health_record が文字列でない記録が invalid として数えられることをテスト"""
+        data = '{"health_record": 123, "timestamp": "2025-08-01T08:30:00"}\n'
+        
+        result = import_records(restore_dir, io.BytesIO(data.encode('utf-8')))
+        
+        assert result == {'imported': 0, 'skipped': 0, 'invalid': 1}
+        assert os.listdir(restore_dir) == []
+    
+    def test_タイムゾーン付きの記録は取り込まない(self, restore_dir):
+        """タイムゾーン付きのタイムスタンプを持つ記録が invalid として数えられることをテスト"""
+        data = '{"health_record": "体重: 70kg", "timestamp": "2025-08-16T08:30:00+09:00"}\n'
+        
+        result = import_records(restore_dir, io.BytesIO(data.encode('utf-8')))
+        
+        assert result == {'imported': 0, 'skipped': 0, 'invalid': 1}
+        assert os.listdir(restore_dir) == []
+
+
+def test_キーワードの分割():
+    """コンマ区切りとスペース区切りの両方でキーワードが分割されることをテスト"""
+    assert parse_keywords("体重, 頭痛") == ["体重", "頭痛"]
+    assert parse_keywords("体重 頭痛") == ["体重", "頭痛"]
+    assert parse_keywords("  ") == []
+
+
+class Test記録インデックス:
+    """記録ファイル名インデックスによるページ送りのテストクラス"""
+    
+    @pytest.fixture
+    def index_dir(self, restore_dir):
+        for day in range(1, 8):
+            write_record(restore_dir, f"{day}日目の記録", f"2025-08-{day:02d}T08:30:00")
+        return restore_dir
+    
+    def test_最新のページを新しい順に返す(self, index_dir):
+        """カーソルなしのとき最新の記録から新しい順に返ることをテスト"""
+        page = RecordIndex(index_dir).load_page(limit=3)
+        
+        assert [record['health_record'] for record in page['records']] == ["7日目の記録", "6日目の記録", "5日目の記録"]
+        assert page['next_cursor'] == '20250805_083000'
+        assert page['prev_cursor'] is None
+    
+    def test_beforeカーソルで古いページを返す(self, index_dir):
+        """before カーソルより古い記録が返り、最後のページでは next_cursor がなくなることをテスト"""
+        index = RecordIndex(index_dir)
+        
+        page = index.load_page(before='20250803_083000', limit=3)
+        
+        assert [record['id'] for record in page['records']] == ['20250802_083000', '20250801_083000']
+        assert page['next_cursor'] is None
+        assert page['prev_cursor'] == '20250802_083000'
+    
+    def test_afterカーソルで新しいページを返す(self, index_dir):
+        """after カーソルより新しい記録のうちカーソルに近いものが返ることをテスト"""
+        page = RecordIndex(index_dir).load_page(after='20250802_083000', limit=2)
+        
+        assert [record['id'] for record in page['records']] == ['20250804_083000', '20250803_083000']
+        assert page['next_cursor'] == '20250803_083000'
+        assert page['prev_cursor'] == '20250804_083000'
+    
+    def test_ページに含まれる記録だけを読み込む(self, index_dir, monkeypatch):
+        """1ページ分のファイルだけが開かれることをテスト"""
+        import builtins
+        opened = []
+        original_open = builtins.open
+        
+        def tracking_open(path, *args, **kwargs):
+            opened.append(path)
+            return original_open(path, *args, **kwargs)
+        
+        index = RecordIndex(index_dir)
+        index.refresh()
+        monkeypatch.setattr(builtins, 'open', tracking_open)
+        index.load_page(limit=2)
+        
+        assert len(opened) == 2
+    
+    def test_追加したファイルがインデックスに反映される(self, index_dir, monkeypatch):
+        """add() したファイルがディレクトリを読み直さずにページに含まれることをテスト"""
+        index = RecordIndex(index_dir)
+        index.refresh()
+        write_record(index_dir, "8日目の記録", "2025-08-08T08:30:00")
+        index.add('health_record_20250808_083000.json')
+        
+        def fail_scandir(path):
+            raise AssertionError('ディレクトリを読み直した')
+        
+        monkeypatch.setattr(os, 'scandir', fail_scandir)
+        page = index.load_page(limit=1)
+        
+        assert page['records'][0]['health_record'] == "8日目の記録"
+        assert len(index) == 8
+    
+    def test_ディレクトリに増えたファイルが反映される(self, index_dir):
+        """add() を経由せずに保存されたファイルも refresh() で反映されることをテスト"""
+        index = RecordIndex(index_dir)
+        index.refresh()
+        write_record(index_dir, "8日目の記録", "2025-08-08T08:30:00")
+        # 更新時刻の粒度が粗いファイルシステムでも変化が分かるようにする
+        os.utime(index_dir, ns=(0, 0))
+        
+        page = index.load_page(limit=1)
+        
+        assert page['records'][0]['health_record'] == "8日目の記録"
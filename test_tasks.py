@@ -0,0 +1,140 @@
+import pytest
+import os
+import json
+import shutil
+import tempfile
+import threading
+import time
+from tasks import TaskExecutor
+
+
+@pytest.fixture
+def queue_dir():
+    temp_dir = tempfile.mkdtemp()
+    yield os.path.join(temp_dir, '.tasks')
+    shutil.rmtree(temp_dir)
+
+
+def queued_files(queue_dir):
+    return sorted(f for f in os.listdir(queue_dir) if f.endswith('.json'))
+
+
+class Testタスク実行器:
+    """バックグラウンドタスク実行器のテストクラス"""
+    
+    def test_投入したジョブが実行されファイルが消える(self, queue_dir):
+        """投入したジョブが実行され、完了後にキューファイルが削除されることをテスト"""
+        results = []
+        executor = TaskExecutor(queue_dir)
+        executor.register('append', lambda value: results.append(value))
+        
+        executor.submit('append', value=1)
+        
+        assert executor.wait(timeout=5)
+        assert results == [1]
+        assert queued_files(queue_dir) == []
+        executor.shutdown()
+    
+    def test_失敗したジョブは再試行される(self, queue_dir):
+        """例外を出したジョブが再試行され、最終的に成功することをテスト"""
+        attempts = []
+        
+        def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise RuntimeError('一時的なエラー')
+        
+        executor = TaskExecutor(queue_dir, max_retries=3, retry_delay=0)
+        executor.register('flaky', flaky)
+        
+        executor.submit('flaky')
+        
+        assert executor.wait(timeout=5)
+        assert len(attempts) == 3
+        assert queued_files(queue_dir) == []
+        executor.shutdown()
+    
+    def test_再試行回数を超えたジョブは失敗扱いになる(self, queue_dir):
+        """再試行回数を超えたジョブが failed ディレクトリに移されることをテスト"""
+        def broken():
+            raise RuntimeError('恒久的なエラー')
+        
+        executor = TaskExecutor(queue_dir, max_retries=1, retry_delay=0)
+        executor.register('broken', broken)
+        
+        executor.submit('broken')
+        
+        assert executor.wait(timeout=5)
+        assert queued_files(queue_dir) == []
+        assert len(os.listdir(executor.failed_dir)) == 1
+        executor.shutdown()
+    
+    def test_未着手の同じジョブは重複排除される(self, queue_dir):
+        """同じタスク名・引数のジョブが未着手のうちは一つにまとめられることをテスト"""
+        release = threading.Event()
+        results = []
+        executor = TaskExecutor(queue_dir, max_workers=1)
+        executor.register('block', lambda: release.wait(5))
+        executor.register('append', lambda value: results.append(value))
+        
+        # ワーカーを塞いでから同じジョブを投入する
+        executor.submit('block')
+        first = executor.submit('append', value=1)
+        second = executor.submit('append', value=1)
+        executor.submit('append', value=2)
+        release.set()
+        
+        assert executor.wait(timeout=5)
+        assert first == second
+        assert sorted(results) == [1, 2]
+        executor.shutdown()
+    
+    def test_再起動時に未完了のジョブを再実行する(self, queue_dir):
+        """キューに残っていたジョブが recover() で再実行されることをテスト"""
+        os.makedirs(queue_dir)
+        job = {'id': '1_abc', 'name': 'append', 'kwargs': {'value': 7}, 'attempts': 0}
+        with open(os.path.join(queue_dir, '1_abc.json'), 'w', encoding='utf-8') as f:
+            json.dump(job, f)
+        
+        results = []
+        executor = TaskExecutor(queue_dir)
+        executor.register('append', lambda value: results.append(value))
+        
+        assert executor.recover() == 1
+        assert executor.wait(timeout=5)
+        assert results == [7]
+        executor.shutdown()
+    
+    def test_停止後は投入できない(self, queue_dir):
+        """shutdown() の後はジョブを投入できないことをテスト"""
+        executor = TaskExecutor(queue_dir)
+        executor.register('noop', lambda: None)
+        
+        assert executor.shutdown(timeout=5)
+        with pytest.raises(RuntimeError):
+            executor.submit('noop')
+    
+    def test_停止はタイムアウト内に戻り未着手のジョブはファイルに残る(self, queue_dir):
+        """実行中・未着手のジョブが残っていても shutdown() が timeout 内に戻ることをテスト"""
+        release = threading.Event()
+        started = []
+        executor = TaskExecutor(queue_dir, max_workers=1)
+        executor.register('block', lambda value: (started.append(value), release.wait(5)))
+        
+        executor.submit('block', value=1)
+        executor.submit('block', value=2)
+        executor.submit('block', value=3)
+        
+        begin = time.monotonic()
+        drained = executor.shutdown(timeout=0.2)
+        elapsed = time.monotonic() - begin
+        remaining = queued_files(queue_dir)
+        release.set()
+        
+        assert not drained
+        assert elapsed < 1
+        assert len(remaining) == 3
+        # 未着手のジョブは停止後に実行されない
+        time.sleep(0.1)
+        assert started == [1]
+        assert len(queued_files(queue_dir)) == 2
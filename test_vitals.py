@@ -0,0 +1,126 @@
+import threading
+import pytest
+from datetime import datetime
+from vitals import extract_vitals, VitalsStore
+
+
+class Test数値抽出:
+    """記録テキストからの数値抽出のテストクラス"""
+
+    def test_血圧と体重を抽出する(self):
+        """血圧（上下）と体重が抽出されることをテスト"""
+        vitals = extract_vitals("体重: 70.5kg\n血圧: 120/80\n調子: 良好")
+
+        assert vitals == {'systolic': 120.0, 'diastolic': 80.0, 'weight': 70.5}
+
+    def test_脈拍と歩数を抽出する(self):
+        """脈拍と歩数（カンマ区切り）が抽出されることをテスト"""
+        vitals = extract_vitals("脈拍 65\n今日は8,500歩歩いた")
+
+        assert vitals == {'pulse': 65.0, 'steps': 8500.0}
+
+    def test_助詞を挟んだ書き方から抽出する(self):
+        """「血圧は」「脈拍は」「体重は」のように助詞を挟んでも抽出されることをテスト"""
+        assert extract_vitals("血圧は125/85、脈拍は70") == {'systolic': 125.0, 'diastolic': 85.0, 'pulse': 70.0}
+        assert extract_vitals("体重は70.5kg") == {'weight': 70.5}
+
+    def test_万と千を含む歩数を抽出する(self):
+        """「1万2千歩」のような漢数字の単位を含む歩数が正しく換算されることをテスト"""
+        assert extract_vitals("歩数 1万2千歩") == {'steps': 12000.0}
+        assert extract_vitals("1.5万歩歩いた") == {'steps': 15000.0}
+
+    def test_不整脈の回数は脈拍にしない(self):
+        """「不整脈が10回」のような記録が脈拍として抽出されないことをテスト"""
+        assert extract_vitals("不整脈が10回あった") == {}
+        assert extract_vitals("不整脈 10回") == {}
+        assert extract_vitals("脈は72") == {'pulse': 72.0}
+
+    def test_数値がない記録は空になる(self):
+        """数値が含まれない記録からは何も抽出されないことをテスト"""
+        assert extract_vitals("頭痛がひどい 薬を飲んだ") == {}
+
+
+class Test数値ストア:
+    """列指向の数値ストアのテストクラス"""
+
+    @pytest.fixture
+    def store(self):
+        records = [
+            {"health_record": "体重: 72kg 血圧: 130/85", "timestamp": "2025-08-03T08:30:00"},
+            {"health_record": "体重: 70kg 血圧: 120/80", "timestamp": "2025-08-01T08:30:00"},
+            {"health_record": "頭痛がひどい", "timestamp": "2025-08-02T08:30:00"},
+            {"health_record": "体重: 71kg", "timestamp": "2025-08-02T17:30:00"},
+        ]
+        return VitalsStore.from_records(records)
+
+    def test_数値を含む記録のみ時刻順に格納される(self, store):
+        """数値を含む記録だけがタイムスタンプ順に格納されることをテスト"""
+        assert len(store) == 3
+        assert list(store.columns['weight']) == [70.0, 71.0, 72.0]
+
+    def test_期間内の集計値を計算する(self, store):
+        """平均・最小・最大と移動平均が計算されることをテスト"""
+        stats = store.stats(fields=['weight', 'systolic'], window=2)
+
+        assert stats['weight']['count'] == 3
+        assert stats['weight']['mean'] == 71.0
+        assert stats['weight']['min'] == 70.0
+        assert stats['weight']['max'] == 72.0
+        assert [point['value'] for point in stats['weight']['moving_average']] == [70.5, 71.5]
+        # 血圧は2件のみ（体重だけの記録は欠損扱い）
+        assert stats['systolic']['count'] == 2
+
+    def test_開始日時で絞り込まれる(self, store):
+        """開始日時以降の記録のみ集計されることをテスト"""
+        stats = store.stats(start=datetime(2025, 8, 2), fields=['weight'])
+
+        assert stats['weight']['count'] == 2
+        assert stats['weight']['min'] == 71.0
+
+    def test_記録を追加すると時刻順の位置に入る(self, store):
+        """追加した記録がタイムスタンプ順の位置に挿入されることをテスト"""
+        store.add_record({"health_record": "体重: 69kg", "timestamp": "2025-07-31T08:30:00"})
+
+        assert list(store.columns['weight']) == [69.0, 70.0, 71.0, 72.0]
+
+    def test_同じ記録を再追加しても件数は変わらない(self, store):
+        """同じタイムスタンプの記録を追加すると置き換えられ、件数が増えないことをテスト"""
+        size = len(store)
+        record = {"health_record": "体重: 73kg", "timestamp": "2025-08-03T08:30:00"}
+
+        store.add_record(record)
+        store.add_record(record)
+
+        assert len(store) == size
+        assert store.stats(fields=['weight'])['weight']['max'] == 73.0
+
+    def test_追加と集計を並行して実行できる(self, store):
+        """別スレッドで記録を追加しながら集計しても列の長さがずれないことをテスト"""
+        def add_records():
+            for day in range(1, 29):
+                store.add_record({"health_record": f"体重: {60 + day}kg", "timestamp": f"2025-09-{day:02d}T08:30:00"})
+                store.add_record({"health_record": "体重: 50kg", "timestamp": "2025-08-01T08:30:00"})
+
+        writer = threading.Thread(target=add_records)
+        writer.start()
+        while writer.is_alive():
+            stats = store.stats(fields=['weight'])
+            assert stats['weight']['count'] == len(stats['weight']['moving_average']) + min(7, stats['weight']['count']) - 1
+        writer.join()
+
+        assert store.stats(fields=['weight'])['weight']['count'] == 31
+
+    def test_移動平均の点数を制限できる(self, store):
+        """limit を指定すると移動平均が新しい方からその点数だけになることをテスト"""
+        stats = store.stats(fields=['weight'], window=1, limit=2)
+
+        assert [point['value'] for point in stats['weight']['moving_average']] == [71.0, 72.0]
+        assert stats['weight']['count'] == 3
+
+    def test_サマリーテキストを作成する(self, store):
+        """プロンプト用のサマリーに項目名と平均値が含まれることをテスト"""
+        summary = store.summary_text()
+
+        assert '体重: 平均71kg' in summary
+        assert '最高血圧' in summary
+        assert '歩数' not in summary
@@ -0,0 +1,210 @@
+import re
+import threading
+from datetime import datetime
+
+import numpy as np
+
+
+# 抽出対象の項目（列）
+VITAL_FIELDS = ('systolic', 'diastolic', 'pulse', 'weight', 'steps')
+
+# 項目の表示名と単位
+VITAL_LABELS = {
+    'systolic': ('最高血圧', 'mmHg'),
+    'diastolic': ('最低血圧', 'mmHg'),
+    'pulse': ('脈拍', 'bpm'),
+    'weight': ('体重', 'kg'),
+    'steps': ('歩数', '歩'),
+}
+
+# 項目名と数値の間の区切り（「血圧: 120/80」「血圧は120/80」のような書き方を許す）
+_SEPARATOR = r'\s*(?:[:：]|は|が|も)?\s*'
+# 歩数は「1万2千歩」「1.2万歩」のように万・千を含む書き方も受け付ける
+_STEPS_NUMBER = r'(\d[\d,]*(?:\.\d+)?(?:\s*[万千]\s*(?:\d[\d,]*(?:\.\d+)?)?)*)'
+
+_BLOOD_PRESSURE_PATTERN = re.compile(r'(?:血圧|BP)' + _SEPARATOR + r'(\d{2,3})\s*[/／]\s*(\d{2,3})', re.IGNORECASE)
+# 「不整脈」「動脈」「静脈」の「脈」は脈拍として扱わない
+_PULSE_PATTERN = re.compile(r'(?:脈拍|心拍数?|(?<![整動静])脈|pulse)' + _SEPARATOR + r'(\d{2,3})', re.IGNORECASE)
+_WEIGHT_PATTERN = re.compile(r'体重' + _SEPARATOR + r'(\d{2,3}(?:\.\d+)?)\s*(?:kg|ｋｇ|キロ)?', re.IGNORECASE)
+_STEPS_PATTERN = re.compile(r'(?:歩数' + _SEPARATOR + _STEPS_NUMBER + r'|' + _STEPS_NUMBER + r'\s*歩)')
+_KANJI_UNIT_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*([万千]?)')
+_KANJI_UNITS = {'万': 10000, '千': 1000, '': 1}
+
+
+def _parse_steps(text):
+    """「8,500」「1万2千」「1.2万」のような歩数表記を数値に変換する"""
+    return sum(
+        float(number) * _KANJI_UNITS[unit]
+        for number, unit in _KANJI_UNIT_PATTERN.findall(text.replace(',', ''))
+    )
+
+
+def extract_vitals(text):
+    """自由形式の記録テキストから血圧・脈拍・体重・歩数を抽出する
+
+    見つからなかった項目は結果に含めない。
+    """
+    vitals = {}
+    if not text:
+        return vitals
+
+    match = _BLOOD_PRESSURE_PATTERN.search(text)
+    if match:
+        vitals['systolic'] = float(match.group(1))
+        vitals['diastolic'] = float(match.group(2))
+
+    match = _PULSE_PATTERN.search(text)
+    if match:
+        vitals['pulse'] = float(match.group(1))
+
+    match = _WEIGHT_PATTERN.search(text)
+    if match:
+        vitals['weight'] = float(match.group(1))
+
+    match = _STEPS_PATTERN.search(text)
+    if match:
+        steps = match.group(1) or match.group(2)
+        vitals['steps'] = _parse_steps(steps)
+
+    return vitals
+
+
+class VitalsStore:
+    """タイムスタンプをキーにした数値データの列指向ストア
+
+    各項目はタイムスタンプ順に並んだNumPy配列として保持し、値がない箇所はNaNとする。
+    """
+
+    def __init__(self):
+        self.timestamps = np.array([], dtype='datetime64[s]')
+        self.columns = {field: np.array([], dtype=np.float64) for field in VITAL_FIELDS}
+        # バックグラウンドでの追記と集計が同時に走っても列の長さがずれないようにする
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_records(cls, records):
+        """健康記録のリストから一括でストアを構築する"""
+        timestamps = []
+        rows = []
+        for record in records:
+            vitals = extract_vitals(record.get('health_record', ''))
+            if not vitals:
+                continue
+            try:
+                timestamps.append(np.datetime64(datetime.fromisoformat(record['timestamp']), 's'))
+            except (KeyError, ValueError):
+                continue
+            rows.append(vitals)
+
+        store = cls()
+        if not rows:
+            return store
+
+        order = np.argsort(np.array(timestamps, dtype='datetime64[s]'), kind='stable')
+        store.timestamps = np.array(timestamps, dtype='datetime64[s]')[order]
+        for field in VITAL_FIELDS:
+            values = np.array([row.get(field, np.nan) for row in rows], dtype=np.float64)
+            store.columns[field] = values[order]
+        return store
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def add_record(self, record):
+        """記録を1件追加する（数値が含まれない記録は無視する）
+
+        同じタイムスタンプの記録がすでにあれば置き換えるので、同じ記録を何度追加してもよい。
+        """
+        vitals = extract_vitals(record.get('health_record', ''))
+        if not vitals:
+            return False
+        timestamp = np.datetime64(datetime.fromisoformat(record['timestamp']), 's')
+
+        with self._lock:
+            # 時刻順を保つ位置に挿入する（通常は末尾への追加になる）
+            index = np.searchsorted(self.timestamps, timestamp, side='left')
+            if index < len(self.timestamps) and self.timestamps[index] == timestamp:
+                # stats()がロック外で読んでいる配列は書き換えず、複製を差し替える
+                for field in VITAL_FIELDS:
+                    column = self.columns[field].copy()
+                    column[index] = vitals.get(field, np.nan)
+                    self.columns[field] = column
+                return True
+
+            self.timestamps = np.insert(self.timestamps, index, timestamp)
+            for field in VITAL_FIELDS:
+                self.columns[field] = np.insert(self.columns[field], index, vitals.get(field, np.nan))
+        return True
+
+    def _range_slice(self, start=None, end=None):
+        """期間に対応する配列のスライスを二分探索で求める"""
+        lo = 0 if start is None else np.searchsorted(self.timestamps, np.datetime64(start, 's'), side='left')
+        hi = len(self.timestamps) if end is None else np.searchsorted(self.timestamps, np.datetime64(end, 's'), side='right')
+        return slice(lo, hi)
+
+    def stats(self, start=None, end=None, fields=None, window=7, limit=None):
+        """期間内の各項目の集計値（件数・平均・最小・最大・移動平均）を返す
+
+        limit を指定すると移動平均は新しい方から limit 点だけを返す（None なら期間内のすべて）。
+        """
+        if fields is None:
+            fields = VITAL_FIELDS
+        window = max(int(window), 1)
+
+        # 配列は追記・置き換えのたびに作り直されるので、ロック内で参照を取れば以降は変わらない
+        with self._lock:
+            span = self._range_slice(start, end)
+            timestamps = self.timestamps[span]
+            columns = {field: self.columns[field][span] for field in fields}
+
+        result = {}
+        for field in fields:
+            values = columns[field]
+            present = ~np.isnan(values)
+            count = int(np.count_nonzero(present))
+            if count == 0:
+                result[field] = {'count': 0, 'mean': None, 'min': None, 'max': None, 'moving_average': []}
+                continue
+
+            observed = values[present]
+            observed_times = timestamps[present]
+            # 直近window件の単純移動平均（先頭の件数が足りない部分は出力しない）
+            size = min(window, count)
+            cumulative = np.cumsum(np.insert(observed, 0, 0.0))
+            moving = (cumulative[size:] - cumulative[:-size]) / size
+            moving_times = observed_times[size - 1:]
+            if limit is not None:
+                skip = max(len(moving) - int(limit), 0)
+                moving, moving_times = moving[skip:], moving_times[skip:]
+
+            result[field] = {
+                'count': count,
+                'mean': round(float(observed.mean()), 2),
+                'min': float(observed.min()),
+                'max': float(observed.max()),
+                'moving_average': [
+                    {'timestamp': str(ts), 'value': round(float(value), 2)}
+                    for ts, value in zip(moving_times, moving)
+                ],
+            }
+        return result
+
+    def summary_text(self, start=None, end=None):
+        """プロンプト用の簡潔な数値サマリーを作成する"""
+        lines = []
+        for field, stat in self.stats(start, end, window=1, limit=0).items():
+            if stat['count'] == 0:
+                continue
+            label, unit = VITAL_LABELS[field]
+            lines.append(
+                f"- {label}: 平均{_format_number(stat['mean'])}{unit}"
+                f" (最小{_format_number(stat['min'])} / 最大{_format_number(stat['max'])}, {stat['count']}件)"
+            )
+        return '\n'.join(lines)
+
+
+def _format_number(value):
+    """整数値は小数点なしで表示する"""
+    if float(value).is_integer():
+        return str(int(value))
+    return f'{value:.1f}'